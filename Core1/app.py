@@ -4,6 +4,7 @@ import json
 import os
 import pandas as pd
 from ultralytics import YOLO
+from camera_source import LatestFrameCapture
 from deepface import DeepFace
 from datetime import datetime
 
@@ -47,7 +48,7 @@ def mark_attendance(name):
     else:
         return False
 
-cap = cv2.VideoCapture("data/raw_footage.mp4")
+cap = LatestFrameCapture("data/raw_footage.mp4")
 
 processed_faces = set()
 
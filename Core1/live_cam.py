@@ -3,6 +3,7 @@ import torch
 import numpy as np
 import json
 from ultralytics import YOLO
+from camera_source import LatestFrameCapture
 
 # Load ROI from JSON file
 def load_roi(filename="roi_config.json"):
@@ -19,36 +20,43 @@ model = YOLO("yolov11s-face.pt")  # Use the smallest YOLOv8 model trained for fa
 
 # Open recorded video file
 video_path = "data/raw_footage.mp4"  # <-- Change this to your recorded footage
-cap = cv2.VideoCapture(video_path)
+cap = LatestFrameCapture(video_path)
 
 polygon_points = load_roi()
 if polygon_points is None:
     print("No saved ROI found. Please select ROI first.")
     exit()
 
+# ROI bounding rectangle and its mask, built once (clipped to the frame on the first read)
+roi_x, roi_y, roi_w, roi_h = cv2.boundingRect(polygon_points)
+roi_mask = None
+
 while cap.isOpened():
     ret, frame = cap.read()
     if not ret:
         break
 
-    height, width = frame.shape[:2]
-
-    # Create a mask for the ROI
-    mask = np.zeros_like(frame, dtype=np.uint8)
-    cv2.fillPoly(mask, [polygon_points], (255, 255, 255))
-    roi_frame = cv2.bitwise_and(frame, mask)
+    if roi_mask is None:
+        height, width = frame.shape[:2]
+        roi_x, roi_y = max(0, roi_x), max(0, roi_y)
+        roi_w, roi_h = min(roi_w, width - roi_x), min(roi_h, height - roi_y)
+        roi_mask = np.zeros((roi_h, roi_w), dtype=np.uint8)
+        cv2.fillPoly(roi_mask, [polygon_points - (roi_x, roi_y)], 1)
 
-    # Perform YOLO face detection
+    # Perform YOLO face detection on the ROI's bounding rectangle only
+    roi_frame = frame[roi_y:roi_y + roi_h, roi_x:roi_x + roi_w]
     results = model(roi_frame)
 
-    # Draw bounding boxes around detected faces
+    # Draw bounding boxes around detected faces whose centre lies inside the ROI
     for result in results:
         for box in result.boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0])  # Convert to int
+            x1, y1, x2, y2 = map(int, box.xyxy[0])  # Convert to int, relative to the rectangle
             confidence = box.conf[0].item()
+            if not roi_mask[(y1 + y2) // 2, (x1 + x2) // 2]:
+                continue
 
             if confidence > 0.5:  # Confidence threshold
-                cv2.rectangle(frame, (x1+8, y1+8), (x2+8, y2+8), (0, 255, 0), 2)
+                cv2.rectangle(frame, (x1 + roi_x, y1 + roi_y), (x2 + roi_x, y2 + roi_y), (0, 255, 0), 2)
 
     cv2.imshow("YOLOv8 Face Detection with ROI", frame)
 
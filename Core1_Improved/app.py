@@ -8,6 +8,7 @@ from deepface import DeepFace
 from datetime import datetime
 import logging
 import time
+from camera_source import LatestFrameCapture
 
 logging.basicConfig(filename="face_recognition.log", level=logging.ERROR)
 
@@ -35,12 +36,10 @@ if os.path.exists(attendance_file):
     today_date = datetime.now().strftime("%Y-%m-%d")
     attendance_today = {name: True for name in df[df["Date"] == today_date]["Name"]}
 
-cap = cv2.VideoCapture("data/NVR_ch23_main_20250322143510_20250322144356.dav")
-
-fps = cap.get(cv2.CAP_PROP_FPS)
+# Played back in real time on a reader thread; frames arriving while a frame is processed are dropped
+cap = LatestFrameCapture("data/NVR_ch23_main_20250322143510_20250322144356.dav")
 
 target_interval = 0.2
-frame_skip = int(fps * target_interval)
 
 cropped_faces_display = {}
 
@@ -76,9 +75,7 @@ while cap.isOpened():
         break
 
     frame_count += 1
-    if frame_count % frame_skip != 0:
-        continue
-
+    started = time.time()
     results = model(frame)
     for result in results:
         for box in result.boxes:
@@ -142,7 +139,8 @@ while cap.isOpened():
 
     cv2.imshow("Face Recognition Attendance", frame)
 
-    key = cv2.waitKey(int(1000 / fps))
+    # Process at most one frame per target_interval
+    key = cv2.waitKey(max(1, int((target_interval - (time.time() - started)) * 1000)))
     if key & 0xFF == ord("q"):
         break
 
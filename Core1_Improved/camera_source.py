@@ -0,0 +1,127 @@
+import threading
+import time
+import cv2
+
+class LatestFrameCapture:
+    """cv2.VideoCapture drained on a background thread, keeping only the newest frame.
+
+    The reader thread only grab()s, so the driver buffer is emptied as fast
+    as the camera delivers without decoding frames nobody will look at; a
+    consumer that spends seconds in YOLO or DeepFace retrieve()s the frame
+    grabbed just now instead of the next one queued behind it. Frames that
+    are replaced before anybody took them are counted in `dropped`. With
+    `on_frame` set (a preview that shows every frame) the reader decodes
+    each frame itself and hands it over.
+
+    Video files are paced at their own frame rate to behave like a live
+    camera (pass realtime=False to read them as fast as possible).
+    """
+
+    def __init__(self, source=0, width=None, height=None, realtime=None, on_frame=None):
+        self.cap = cv2.VideoCapture(source)
+        if width:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.realtime = isinstance(source, str) if realtime is None else realtime
+        self.on_frame = on_frame
+        self.cond = threading.Condition()
+        self.device_lock = threading.Lock()  # grab() and retrieve() must not interleave
+        self.frame = None
+        self.timestamp = 0.0
+        self.frame_id = 0
+        self.taken_id = 0
+        self.last_read_id = 0
+        self.captured = 0
+        self.dropped = 0
+        self.ended = False
+        self.stop_event = threading.Event()
+        self.thread = None
+        if self.cap.isOpened():
+            self.thread = threading.Thread(target=self._reader, daemon=True)
+            self.thread.start()
+
+    def isOpened(self):
+        return self.thread is not None and not self.ended
+
+    def _reader(self):
+        fps = self.cap.get(cv2.CAP_PROP_FPS) if self.realtime else 0
+        interval = 1.0 / fps if fps and fps > 0 else (1.0 / 25 if self.realtime else 0)
+        next_read = time.time()
+        while not self.stop_event.is_set():
+            frame = None
+            with self.device_lock:
+                ret = self.cap.grab()
+                if ret and self.on_frame is not None:
+                    ret, frame = self.cap.retrieve()
+            now = time.time()
+            if not ret:
+                break
+            with self.cond:
+                if self.frame_id > self.taken_id:
+                    self.dropped += 1
+                self.frame = frame
+                self.timestamp = now
+                self.frame_id += 1
+                self.captured += 1
+                self.cond.notify_all()
+            if self.on_frame is not None:
+                self.on_frame(frame)
+            if interval:
+                next_read = max(next_read + interval, now - interval)
+                self.stop_event.wait(max(0.0, next_read - time.time()))
+        with self.cond:
+            self.ended = True
+            self.cond.notify_all()
+
+    def latest(self, newer_than=0, timeout=2.0):
+        """(frame, timestamp, frame_id) of the newest frame, waiting until one
+        newer than `newer_than` arrives; frame is None on timeout or end of stream"""
+        deadline = time.time() + timeout
+        with self.cond:
+            while self.frame_id <= newer_than and not self.ended:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None, 0.0, self.frame_id
+                self.cond.wait(remaining)
+            if self.frame_id <= newer_than:
+                return None, 0.0, self.frame_id
+            if self.frame is not None:
+                self.taken_id = self.frame_id
+                return self.frame, self.timestamp, self.frame_id
+        with self.device_lock:
+            # No grab() can run meanwhile, so this decodes the newest grabbed frame
+            ret, frame = self.cap.retrieve()
+            with self.cond:
+                if not ret or frame is None:
+                    return None, 0.0, self.frame_id
+                self.frame = frame
+                self.taken_id = self.frame_id
+                return self.frame, self.timestamp, self.frame_id
+
+    def read(self, timeout=2.0):
+        """Drop-in for cap.read(): the newest frame not yet returned by read()"""
+        frame, _, frame_id = self.latest(self.last_read_id, timeout)
+        if frame is None:
+            return False, None
+        self.last_read_id = frame_id
+        return True, frame
+
+    def release(self):
+        self.stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        with self.device_lock:
+            self.cap.release()
+
+    def stats_text(self):
+        return f"Camera: {self.captured} frames, {self.dropped} dropped unprocessed"
+
+def open_camera(indices=(0, 1, 2, 3), width=None, height=None, on_frame=None):
+    """LatestFrameCapture on the first camera index that opens, or None"""
+    for index in indices:
+        camera = LatestFrameCapture(index, width, height, on_frame=on_frame)
+        if camera.isOpened():
+            return camera
+        camera.release()
+    return None
@@ -13,7 +13,7 @@ def load_config(config_file="recognition_config.json"):
                 "max_distance": 0.6,
                 "min_face_size": 50,
                 "consecutive_frames": 3,
-                "quality_threshold": 0.3,
+                "quality_threshold": 0.2,
                 "high_confidence_threshold": 0.6,
                 "history_length": 10,
                 "consistency_check_frames": 5
@@ -162,19 +162,19 @@ def show_recommendations():
     print("- Lower max_distance to 0.4-0.5")
     print("- Increase high_confidence_threshold to 0.7-0.8")
     print("- Increase consecutive_frames to 4-5")
-    print("- Increase quality_threshold to 0.4-0.5")
+    print("- Increase quality_threshold to 0.3-0.4")
     
     print("\n🟡 FACES NOT BEING RECOGNIZED:")
     print("- Increase max_distance to 0.7-0.8")
     print("- Lower high_confidence_threshold to 0.4-0.5")
     print("- Decrease consecutive_frames to 2-3")
-    print("- Lower quality_threshold to 0.2-0.3")
+    print("- Lower quality_threshold to 0.1-0.15")
     
     print("\n🟢 BALANCED SETTINGS (Recommended):")
     print("- max_distance: 0.6")
     print("- high_confidence_threshold: 0.6")
     print("- consecutive_frames: 3")
-    print("- quality_threshold: 0.3")
+    print("- quality_threshold: 0.2")
     print("- min_confidence: 0.5")
 
 def main():
@@ -5,7 +5,12 @@ import os
 import pandas as pd
 from ultralytics import YOLO
 from deepface import DeepFace
-from datetime import datetime, timedelta
+from attendance_ledger import AttendanceLedger
+from frame_scheduler import FrameScheduler
+from camera_source import LatestFrameCapture
+from face_tracker import FaceTracker
+from roi_stage import RoiStage
+from face_quality import score_faces, weakest_component
 import logging
 import time
 
@@ -22,7 +27,7 @@ def load_config(config_file="recognition_config.json"):
                 "max_distance": 0.6,
                 "min_face_size": 50,
                 "consecutive_frames": 3,
-                "quality_threshold": 0.3,
+                "quality_threshold": 0.2,
                 "high_confidence_threshold": 0.6,
                 "history_length": 10,
                 "consistency_check_frames": 5
@@ -37,6 +42,18 @@ def load_config(config_file="recognition_config.json"):
                 "log_level": "INFO",
                 "log_errors": True,
                 "log_recognition": False
+            },
+            "tracking": {
+                "iou_threshold": 0.3,
+                "centroid_threshold": 0.5,
+                "max_age": 2.0,
+                "reverify_interval": 5.0,
+                "unknown_retry_interval": 1.0
+            },
+            "scheduler": {
+                "target_fps": 2.5,
+                "latency_budget": 0.5,
+                "report_interval": 10.0
             }
         }
 
@@ -54,44 +71,42 @@ config = load_config()
 face_config = config["face_recognition"]
 display_config = config["display"]
 logging_config = config["logging"]
+scheduler_config = {"target_fps": 2.5, "latency_budget": 0.5, "report_interval": 10.0}
+scheduler_config.update(config.get("scheduler", {}))
+tracking_config = {"iou_threshold": 0.3, "centroid_threshold": 0.5, "max_age": 2.0, "reverify_interval": 5.0,
+                   "unknown_retry_interval": 1.0}
+tracking_config.update(config.get("tracking", {}))
 
 # Setup logging
 log_level = getattr(logging, logging_config["log_level"].upper())
 logging.basicConfig(filename="face_recognition.log", level=log_level)
 
 # Initialize components
-polygon_roi = load_roi()
+# YOLO only sees the ROI's bounding rectangle; mask and rectangle are built on the first frame
+roi = RoiStage(load_roi())
 model = YOLO("yolov11n-face.pt")
 KNOWN_FACES_DIR = "known_faces"
 os.makedirs(KNOWN_FACES_DIR, exist_ok=True)
 
 # Attendance tracking
 attendance_file = "attendance.csv"
-attendance_today = set()
-today_date = datetime.now().strftime("%Y-%m-%d")
+ledger = AttendanceLedger(attendance_file)
 
-if os.path.exists(attendance_file):
-    try:
-        df = pd.read_csv(attendance_file)
-        if "Date" in df.columns and "Name" in df.columns:
-            today_df = df[df["Date"] == today_date]
-            attendance_today = set(today_df["Name"])
-        else:
-            print("CSV missing 'Date' or 'Name' columns. Resetting attendance.")
-    except Exception as e:
-        print(f"Error reading attendance file: {e}")
-
-# Video capture setup
-cap = cv2.VideoCapture(0)
+# Video capture setup: a background thread keeps only the newest frame
+cap = LatestFrameCapture(0)
 if not cap.isOpened():
     print("Error: Could not open webcam")
     exit()
 
-fps = cap.get(cv2.CAP_PROP_FPS)
-target_interval = 0.4
-frame_skip = int(fps * target_interval)
+# Frames are paced by measured processing time, not the fps the camera reports (often 0)
+scheduler = FrameScheduler(**scheduler_config)
 
-# Tracking variables
+# Tracking variables; history, votes and confirmed faces are keyed by track id
+tracker = FaceTracker(
+    iou_threshold=tracking_config["iou_threshold"],
+    centroid_threshold=tracking_config["centroid_threshold"],
+    max_age=tracking_config["max_age"]
+)
 cropped_faces_display = {}
 face_embeddings_cache = set()
 face_recognition_history = {}
@@ -100,118 +115,27 @@ frame_count = 0
 def mark_attendance(name, face_crop):
     print(f"DEBUG: Attempting to mark attendance for {name}")
     global cropped_faces_display
-    current_time = datetime.now().strftime("%H:%M:%S")
-    now = datetime.now()
-    today_date = now.strftime("%Y-%m-%d")
-    required_columns = ["Name", "Date", "Time", "Type"]
-    recreate_file = False
-    if not os.path.exists(attendance_file):
-        recreate_file = True
-    else:
-        try:
-            df = pd.read_csv(attendance_file)
-            if list(df.columns) != required_columns:
-                print(f"DEBUG: CSV columns are {list(df.columns)}, expected {required_columns}. Recreating file.")
-                recreate_file = True
-        except Exception as e:
-            print(f"DEBUG: Error reading CSV: {e}. Recreating file.")
-            recreate_file = True
-    if recreate_file:
-        pd.DataFrame({col: [] for col in required_columns}).to_csv(attendance_file, index=False)
-        print(f"DEBUG: Created new attendance file with columns {required_columns}")
-
-    # Load today's attendance
-    df = pd.read_csv(attendance_file)
-    today_df = df[df["Date"] == today_date]
-    person_entries = today_df[today_df["Name"] == name]
-
-    print("DEBUG: person_entries:")
-    print(person_entries)
-    if isinstance(person_entries, pd.DataFrame) and not person_entries.empty:
-        print("DEBUG: Last entry for today:")
-        print(person_entries.iloc[-1])
-
-    # If no entries today or last status is 'out', mark as 'in'
-    if isinstance(person_entries, pd.DataFrame) and (person_entries.empty or (person_entries.iloc[-1]["Type"] == "out")):
-        new_entry = pd.DataFrame({
-            "Name": [name],
-            "Date": [today_date],
-            "Time": [current_time],
-            "Type": ["in"]
-        })
-        new_entry.to_csv(attendance_file, mode="a", header=False, index=False)
-        print(f"✔️ Attendance IN marked for {name} at {today_date} {current_time}")
+    attendance_status = ledger.mark(name)
+    if attendance_status in ("in", "out"):
+        _, marked_date, marked_time = ledger.last_events[name]
+        print(f"✔️ Attendance {attendance_status.upper()} marked for {name} at {marked_date} {marked_time}")
         cropped_faces_display[name] = {
             "image": face_crop,
             "time": time.time()
         }
         return True
 
-    # If last status is 'in', check if 1 hour has passed since last 'in'
-    if isinstance(person_entries, pd.DataFrame) and not person_entries.empty and person_entries.iloc[-1]["Type"] == "in":
-        last_in = person_entries.iloc[-1]
-        last_in_time = datetime.strptime(f"{last_in['Date']} {last_in['Time']}", "%Y-%m-%d %H:%M:%S")
-        print(f"DEBUG: last_in_time={last_in_time}, now={now}, diff={(now - last_in_time)}")
-        if (now - last_in_time) >= timedelta(hours=1):
-            new_entry = pd.DataFrame({
-                "Name": [name],
-                "Date": [today_date],
-                "Time": [current_time],
-                "Type": ["out"]
-            })
-            new_entry.to_csv(attendance_file, mode="a", header=False, index=False)
-            print(f"✔️ Attendance OUT marked for {name} at {today_date} {current_time}")
-            cropped_faces_display[name] = {
-                "image": face_crop,
-                "time": time.time()
-            }
-            return True
-
     # Otherwise, do nothing
     return False
 
-def is_inside_polygon(x, y, polygon):
-    """Check if point is inside polygon"""
-    if polygon is None:
-        return True
-    return cv2.pointPolygonTest(polygon, (x, y), False) >= 0
-
-def get_face_quality_score(face_crop):
-    """Calculate face quality score based on sharpness and brightness"""
-    if face_crop.size == 0:
-        return 0
-    
-    try:
-        # Convert to grayscale for analysis
-        gray = cv2.cvtColor(face_crop, cv2.COLOR_BGR2GRAY)
-        
-        # Calculate sharpness using Laplacian variance
-        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-        
-        # Calculate brightness
-        brightness = np.mean(gray)
-        
-        # Simple quality score (0-1)
-        sharpness_score = min(laplacian_var / 100, 1.0)
-        brightness_score = 1.0 - abs(brightness - 128) / 128
-        
-        return (sharpness_score + brightness_score) / 2
-    except Exception as e:
-        logging.error(f"Error calculating face quality: {e}")
-        return 0
-
 def get_best_match_from_deepface_result(result):
     if isinstance(result, pd.DataFrame) and not result.empty:  # type: ignore
         return result.iloc[0]  # type: ignore
     return None
 
-def recognize_face_with_confidence(face_crop, face_id_key):
-    """Recognize face with comprehensive confidence checks"""
+def recognize_face_with_confidence(face_crop, face_id_key, quality_score):
+    """Recognize a face that passed the quality gate, with comprehensive confidence checks"""
     try:
-        # Check face quality
-        quality_score = get_face_quality_score(face_crop)
-        if quality_score < face_config["quality_threshold"]:
-            return None, 0, f"Low quality face ({quality_score:.2f})"
         
         verification = DeepFace.find(
             img_path=face_crop,
@@ -318,25 +242,33 @@ print(f"Configuration: Max Distance={face_config['max_distance']}, Min Confidenc
 print("Press 'q' to quit")
 
 while cap.isOpened():
-    ret, frame = cap.read()
-    if not ret:
+    scheduler.wait()
+    frame, captured_at, frame_count = cap.latest(frame_count)
+    if frame is None:
         print("Error reading frame from webcam")
         break
-
-    frame_count += 1
-    if frame_count % frame_skip != 0:
+    if not scheduler.begin(captured_at):
         continue
 
     # Face detection
-    results = model(frame)
+    start = time.time()
+    roi_frame, (offset_x, offset_y) = roi.crop(frame)
+    results = model(roi_frame)
+    scheduler.record("detect", time.time() - start)
     faces_detected = 0
     faces_recognized = 0
 
+    faces = []
     for result in results:
         for box in result.boxes:
             x1, y1, x2, y2 = map(int, box.xyxy[0])
+            x1, y1, x2, y2 = x1 + offset_x, y1 + offset_y, x2 + offset_x, y2 + offset_y
             confidence = box.conf[0].item()
             
+            # Check the box centre against the ROI mask
+            if not roi.contains((x1, y1, x2, y2)):
+                continue
+            
             # Check YOLO confidence
             if confidence < face_config["min_confidence"]:
                 continue
@@ -351,23 +283,54 @@ while cap.isOpened():
             face_crop = frame[y1:y2, x1:x2]
             if face_crop.size == 0:
                 continue
-
-            try:
-                face_id_key = f"{x1}_{y1}_{x2}_{y2}_{frame_count}"
-                
-                # Perform face recognition
-                person_name, recognition_confidence, status = recognize_face_with_confidence(face_crop, face_id_key)
-                
+            faces.append(((x1, y1, x2, y2), face_crop))
+
+    # Follow faces across frames so each one is recognized once and then only re-checked
+    now = time.time()
+    tracks = tracker.update([list(box) for box, _ in faces], now)
+    live_tracks = {track.track_id for track in tracker.tracks}
+    for face_id_key in [k for k in face_recognition_history if k not in live_tracks]:
+        del face_recognition_history[face_id_key]
+    face_embeddings_cache &= live_tracks
+
+    # One vectorized quality pass over every face in the frame
+    quality_scores, quality_parts = score_faces([crop for _, crop in faces], face_config["min_face_size"])
+
+    for k, (((x1, y1, x2, y2), face_crop), track) in enumerate(zip(faces, tracks)):
+        face_id_key = track.track_id
+        person_name = None
+        try:
+            consistent_name, consistent_confidence = get_consistent_recognition(face_id_key)
+            # Keep voting until the track's results agree, then re-verify only now and then
+            if (consistent_name is None and track.name is not None) or track.needs_verification(
+                    now,
+                    tracking_config["reverify_interval"],
+                    tracking_config["unknown_retry_interval"],
+                    face_config["high_confidence_threshold"]):
+                if quality_scores[k] < face_config["quality_threshold"]:
+                    # Rejected before any DeepFace work
+                    weakest, value = weakest_component(quality_parts, k)
+                    person_name, recognition_confidence = None, 0
+                    status = f"Low quality face ({quality_scores[k]:.2f}, {weakest} {value:.2f})"
+                else:
+                    start = time.time()
+                    person_name, recognition_confidence, status = recognize_face_with_confidence(
+                        face_crop, face_id_key, float(quality_scores[k]))
+                    scheduler.record("recognize", time.time() - start)
+                track.record(person_name, recognition_confidence, status, now)
                 if person_name:
-                    # Update face history
                     update_face_history(face_id_key, person_name, recognition_confidence)
-                    
-                    # Check for consistent recognition
                     consistent_name, consistent_confidence = get_consistent_recognition(face_id_key)
-                    
+            else:
+                person_name, recognition_confidence, status = track.name, track.confidence, track.status
+
+            if person_name:
+                faces_recognized += 1
+                # Attendance needs agreeing votes from at least two frames of the same track
+                if consistent_name:
                     # Only close the camera if attendance_marked is True
                     try:
-                        attendance_marked = mark_attendance(person_name, face_crop)
+                        attendance_marked = mark_attendance(consistent_name, face_crop)
                         if attendance_marked:
                             print("Attendance marked, closing camera in 7 seconds.")
                             cv2.putText(frame, "Attendance marked", (x1, y1 - 40),
@@ -391,29 +354,28 @@ while cap.isOpened():
                         print(f"ERROR in mark_attendance: {e}")
                         cv2.putText(frame, "Error", (x1, y1 - 10),
                                     cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-                    # You can comment out the above line for production use
-                    if consistent_name and consistent_confidence > face_config["high_confidence_threshold"]:
-                        if face_id_key not in face_embeddings_cache:
-                            face_embeddings_cache.add(face_id_key)
-                        display_face_info(frame, x1, y1, consistent_name, consistent_confidence, status, True)
-                    else:
-                        display_face_info(frame, x1, y1, person_name, recognition_confidence, status, False)
+                # You can comment out the above line for production use
+                if consistent_name and consistent_confidence > face_config["high_confidence_threshold"]:
+                    if face_id_key not in face_embeddings_cache:
+                        face_embeddings_cache.add(face_id_key)
+                    display_face_info(frame, x1, y1, consistent_name, consistent_confidence, status, True)
                 else:
-                    cv2.putText(frame, "Unknown", (x1, y1 - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-                    
-            except Exception as e:
-                logging.error(f"Face Recognition Error: {str(e)}")
-                cv2.putText(frame, "Error", (x1, y1 - 10),
+                    display_face_info(frame, x1, y1, person_name, recognition_confidence, status, False)
+            else:
+                cv2.putText(frame, "Unknown", (x1, y1 - 10),
                             cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+                
+        except Exception as e:
+            logging.error(f"Face Recognition Error: {str(e)}")
+            cv2.putText(frame, "Error", (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
 
-            # Draw bounding box
-            color = (0, 255, 0) if person_name else (0, 0, 255)
-            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        # Draw bounding box
+        color = (0, 255, 0) if person_name else (0, 0, 255)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
 
     # Display ROI if available
-    if polygon_roi is not None:
-        cv2.polylines(frame, [polygon_roi], isClosed=True, color=(255, 0, 0), thickness=2)
+    roi.draw(frame)
 
     # Display recognized faces
     keys_to_remove = []
@@ -447,10 +409,14 @@ while cap.isOpened():
     cv2.putText(frame, f"Detected: {faces_detected}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
     cv2.putText(frame, f"Recognized: {faces_recognized}", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
     cv2.putText(frame, f"Max Distance: {face_config['max_distance']}", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    cv2.putText(frame, f"Rate: {scheduler.achieved_fps():.1f}/{scheduler_config['target_fps']} fps, "
+                       f"{cap.dropped} dropped", (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    scheduler.end()
 
     cv2.imshow("Improved Face Recognition", frame)
 
-    key = cv2.waitKey(int(1000 / fps))
+    # The scheduler paces the loop, so just poll the keyboard
+    key = cv2.waitKey(1)
     if key & 0xFF == ord("q"):
         break
 
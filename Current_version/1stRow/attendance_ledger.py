@@ -0,0 +1,166 @@
+import csv
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+COLUMNS = ["Name", "Date", "Time", "Type"]
+
+class AttendanceLedger:
+    """Append-only attendance.csv with each person's last event for today kept in memory.
+
+    The CSV is read once when the ledger is opened; afterwards marking
+    attendance is a dict lookup plus a single appended row, so the cost
+    does not grow with the size of the file. All rows are also kept in
+    memory in file order, so a row's index doubles as a sync cursor. The
+    index is only meaningful together with `epoch`, a stamp stored next to
+    the CSV that changes whenever the ledger is recreated.
+    """
+
+    def __init__(self, path, tz=None, out_after=timedelta(hours=1)):
+        self.path = path
+        self.epoch_path = path + ".epoch"
+        self.epoch = None
+        self.tz = tz
+        self.out_after = out_after
+        self.lock = threading.Lock()
+        self.today = None
+        self.last_events = {}
+        self.rows = []
+        self._load()
+        self._file = open(self.path, "a", newline="", buffering=8192)
+        self._writer = csv.writer(self._file, lineterminator="\n")
+
+    def now(self):
+        return datetime.now(self.tz) if self.tz is not None else datetime.now()
+
+    def _localize(self, naive):
+        if self.tz is None:
+            return naive
+        if hasattr(self.tz, "localize"):
+            return self.tz.localize(naive)
+        return naive.replace(tzinfo=self.tz)
+
+    def _load(self):
+        """Read the ledger once, recreating it if the header is missing or wrong"""
+        self.today = self.now().strftime("%Y-%m-%d")
+        self.last_events = {}
+        self.rows = []
+        recreate_file = True
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", newline="") as f:
+                    reader = csv.reader(f)
+                    header = next(reader, None)
+                    if header == COLUMNS:
+                        recreate_file = False
+                        for row in reader:
+                            if len(row) != 4:
+                                continue
+                            self.rows.append(tuple(row))
+                            if row[1] == self.today:
+                                self.last_events[row[0]] = (row[3], row[1], row[2])
+                    else:
+                        print(f"[WARN] CSV columns are {header}, expected {COLUMNS}. Recreating file.")
+            except Exception as e:
+                print(f"[WARN] Error reading {self.path}: {e}. Recreating file.")
+        self.epoch = None if recreate_file else self._read_epoch()
+        if self.epoch is None:
+            # New or recreated ledger (or one from before epochs): old cursors no longer apply
+            self.epoch = str(time.time_ns())
+            tmp = f"{self.epoch_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                f.write(self.epoch)
+            os.replace(tmp, self.epoch_path)
+        if recreate_file:
+            with open(self.path, "w", newline="") as f:
+                csv.writer(f, lineterminator="\n").writerow(COLUMNS)
+        else:
+            with open(self.path, "rb+") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+
+    def _read_epoch(self):
+        try:
+            with open(self.epoch_path, "r") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def _append(self, name, date, time_str, event_type):
+        self._writer.writerow([name, date, time_str, event_type])
+        self._file.flush()
+        self.rows.append((name, date, time_str, event_type))
+        last = self.last_events.get(name)
+        if date == self.today and (last is None or time_str >= last[2]):
+            self.last_events[name] = (event_type, date, time_str)
+
+    def _last_event_on(self, name, date):
+        """Last event of name on a past date; scans the rows, so only used for late uploads"""
+        for row_name, row_date, row_time, row_type in reversed(self.rows):
+            if row_name == name and row_date == date:
+                return row_type, row_date, row_time
+        return None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def query(self, since=0, date_from=None, date_to=None, name=None, epoch=None):
+        """Return (rows, next_cursor, reset) for rows appended at or after cursor `since`
+
+        Dates are ISO strings, so the range filter is a plain string
+        comparison. `reset` is True when the cursor belongs to another epoch
+        or is ahead of the ledger (it was recreated); all matching rows are
+        then returned and the caller should drop its local copy.
+        """
+        with self.lock:
+            total = len(self.rows)
+            reset = since > total or (epoch is not None and since > 0 and epoch != self.epoch)
+            new_rows = self.rows[0 if reset else since:total]
+        rows = [
+            row for row in new_rows
+            if (date_from is None or row[1] >= date_from)
+            and (date_to is None or row[1] <= date_to)
+            and (name is None or row[0] == name)
+        ]
+        return rows, total, reset
+
+    def mark(self, name, when=None):
+        """Record an in/out event for name and return "in", "out" or "already_marked"
+
+        A person is marked "in" on their first sighting of the day (or after
+        an "out"), and "out" once `out_after` has passed since their "in".
+        `when` is the capture time of a late (queued) upload; an event from
+        an earlier day is judged against that day's rows and leaves today's
+        state untouched. A late event older than the person's last event of
+        its day is "already_marked": the rows after it already decided the
+        state and the CSV is append-only.
+        """
+        with self.lock:
+            now = when if when is not None else self.now()
+            today_date = now.strftime("%Y-%m-%d")
+            current_time = now.strftime("%H:%M:%S")
+            if today_date > self.today:
+                self.today = today_date
+                self.last_events = {}
+            if today_date < self.today:
+                last = self._last_event_on(name, today_date)
+            else:
+                last = self.last_events.get(name)
+            if last is not None and current_time < last[2]:
+                return "already_marked"
+            if last is None or last[0] == "out":
+                self._append(name, today_date, current_time, "in")
+                return "in"
+            last_in_time = self._localize(datetime.strptime(f"{last[1]} {last[2]}", "%Y-%m-%d %H:%M:%S"))
+            if (now - last_in_time) >= self.out_after:
+                self._append(name, today_date, current_time, "out")
+                return "out"
+            return "already_marked"
+
+    def close(self):
+        with self.lock:
+            self._file.close()
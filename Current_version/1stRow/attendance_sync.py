@@ -0,0 +1,76 @@
+import json
+import os
+import pandas as pd
+import requests
+
+COLUMNS = ["Name", "Date", "Time", "Type"]
+
+class AttendanceSync:
+    """Local copy of the server attendance ledger that only downloads new rows.
+
+    The rows are cached in `cache_path` (CSV) and the server cursor/ETag in
+    `cache_path + ".cursor"`, so each refresh asks `/attendance` only for
+    rows appended since the previous one. The cursor is an opaque string
+    from the server; 0 means "from the start".
+    """
+
+    def __init__(self, url, cache_path, session=None):
+        self.url = url
+        self.cache_path = cache_path
+        self.state_path = cache_path + ".cursor"
+        self.session = session or requests.Session()
+        self.cursor = 0
+        self.etag = None
+        self.df = None
+        self._load_state()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+            self.cursor = state.get("cursor", 0) or 0
+            self.etag = state.get("etag")
+        except (FileNotFoundError, ValueError, AttributeError):
+            self.cursor, self.etag = 0, None
+        if self.cursor and not os.path.exists(self.cache_path):
+            self.cursor, self.etag = 0, None
+
+    def _save_state(self):
+        with open(self.state_path, "w") as f:
+            json.dump({"cursor": self.cursor, "etag": self.etag}, f)
+
+    def _local_rows(self):
+        if self.df is None:
+            if self.cursor and os.path.exists(self.cache_path):
+                self.df = pd.read_csv(self.cache_path, dtype=str)
+            else:
+                self.df = pd.DataFrame(columns=COLUMNS)
+        return self.df
+
+    def refresh(self, timeout=10):
+        """Fetch rows added since the last refresh and return the full DataFrame"""
+        df = self._local_rows()
+        headers = {"Accept-Encoding": "gzip"}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        response = self.session.get(self.url, params={"since": self.cursor}, headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            return df
+        response.raise_for_status()
+        data = response.json()
+        new_rows = pd.DataFrame(data["rows"], columns=data.get("columns", COLUMNS), dtype=str)
+        if data.get("reset"):
+            df = new_rows
+            df.to_csv(self.cache_path, index=False)
+        elif not new_rows.empty:
+            write_header = not os.path.exists(self.cache_path) or not self.cursor
+            new_rows.to_csv(self.cache_path, mode="w" if write_header else "a",
+                            header=write_header, index=False)
+            df = pd.concat([df, new_rows], ignore_index=True)
+        elif not self.cursor:
+            df.to_csv(self.cache_path, index=False)
+        self.df = df
+        self.cursor = data["next_cursor"]
+        self.etag = response.headers.get("ETag")
+        self._save_state()
+        return df
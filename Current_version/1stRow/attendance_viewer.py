@@ -0,0 +1,130 @@
+import tkinter as tk
+from tkinter import ttk
+import pandas as pd
+
+COLUMNS = ["Name", "Date", "Time", "Type"]
+PAGE_SIZE = 200
+
+def compact_attendance(df):
+    """Attendance rows with Name, Date and Type as sorted categoricals.
+
+    A semester repeats a few hundred names and dates over many rows, so
+    categories cut memory sharply, and filters can be evaluated on the
+    small category list and applied with a single isin().
+    """
+    df = df.reindex(columns=COLUMNS)
+    out = pd.DataFrame({"Time": df["Time"].fillna("").astype(str)})
+    for col in ("Name", "Date", "Type"):
+        series = df[col].astype("category")
+        # Sorted categories make sort_values order the rows alphabetically
+        out[col] = series.cat.set_categories(sorted(series.cat.categories), ordered=True)
+    return out[COLUMNS].reset_index(drop=True)
+
+def load_attendance(path):
+    """Read an attendance CSV straight into the compact layout"""
+    df = pd.read_csv(path, dtype={"Name": "category", "Date": "category", "Time": str, "Type": "category"})
+    return compact_attendance(df)
+
+class AttendanceViewer:
+    """Toplevel window with a Treeview over attendance rows.
+
+    Only the rows scrolled into view are inserted, PAGE_SIZE at a time.
+    Date-range and name filters and column sorting are pandas operations
+    on the whole frame that produce a new row order; the tree is then
+    refilled from its first page.
+    """
+
+    def __init__(self, parent, df, title="Attendance Records", page_size=PAGE_SIZE):
+        self.df = compact_attendance(df)
+        self.view = self.df
+        self.page_size = page_size
+        self.loaded = 0
+        self.sort_column = None
+        self.sort_ascending = True
+
+        self.top = tk.Toplevel(parent)
+        self.top.title(title)
+        self.top.geometry("640x480")
+
+        filters = tk.Frame(self.top)
+        filters.pack(fill=tk.X, padx=10, pady=(10, 0))
+        self.date_from = tk.StringVar()
+        self.date_to = tk.StringVar()
+        self.name_filter = tk.StringVar()
+        for label, var, width in (("From (YYYY-MM-DD)", self.date_from, 12),
+                                  ("To", self.date_to, 12),
+                                  ("Name", self.name_filter, 16)):
+            tk.Label(filters, text=label).pack(side=tk.LEFT, padx=(0, 4))
+            entry = tk.Entry(filters, textvariable=var, width=width)
+            entry.pack(side=tk.LEFT, padx=(0, 10))
+            entry.bind("<Return>", lambda event: self.apply_filters())
+        tk.Button(filters, text="Filter", command=self.apply_filters).pack(side=tk.LEFT)
+        tk.Button(filters, text="Clear", command=self.clear_filters).pack(side=tk.LEFT, padx=4)
+
+        body = tk.Frame(self.top)
+        body.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.tree = ttk.Treeview(body, columns=COLUMNS, show="headings")
+        for col in COLUMNS:
+            self.tree.heading(col, text=col, command=lambda c=col: self.sort_by(c))
+            self.tree.column(col, width=140, anchor="w")
+        scrollbar = ttk.Scrollbar(body, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=lambda first, last: self._on_scroll(scrollbar, first, last))
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.status = tk.Label(self.top, anchor="w")
+        self.status.pack(fill=tk.X, padx=10, pady=(0, 10))
+        self.refill()
+
+    def _on_scroll(self, scrollbar, first, last):
+        scrollbar.set(first, last)
+        # Near the bottom of what is loaded: append the next page
+        if float(last) > 0.9 and self.loaded < len(self.view):
+            self.load_page()
+
+    def load_page(self):
+        rows = self.view.iloc[self.loaded:self.loaded + self.page_size]
+        for row in rows.itertuples(index=False, name=None):
+            self.tree.insert("", tk.END, values=row)
+        self.loaded += len(rows)
+        self.status.config(text=f"Showing {self.loaded} of {len(self.view)} matching rows ({len(self.df)} total)")
+
+    def refill(self):
+        self.tree.delete(*self.tree.get_children())
+        self.loaded = 0
+        self.load_page()
+
+    def apply_filters(self):
+        mask = pd.Series(True, index=self.df.index)
+        date_from, date_to = self.date_from.get().strip(), self.date_to.get().strip()
+        if date_from or date_to:
+            dates = [d for d in self.df["Date"].cat.categories
+                     if (not date_from or d >= date_from) and (not date_to or d <= date_to)]
+            mask &= self.df["Date"].isin(dates)
+        needle = self.name_filter.get().strip().lower()
+        if needle:
+            names = [n for n in self.df["Name"].cat.categories if needle in n.lower()]
+            mask &= self.df["Name"].isin(names)
+        self.view = self.df[mask]
+        self._sort_view()
+        self.refill()
+
+    def clear_filters(self):
+        for var in (self.date_from, self.date_to, self.name_filter):
+            var.set("")
+        self.apply_filters()
+
+    def sort_by(self, column):
+        if self.sort_column == column:
+            self.sort_ascending = not self.sort_ascending
+        else:
+            self.sort_column, self.sort_ascending = column, True
+        self._sort_view()
+        self.refill()
+
+    def _sort_view(self):
+        if self.sort_column is None:
+            return
+        # Dates sort together with their times; stable sort keeps ledger order for ties
+        keys = ["Date", "Time"] if self.sort_column == "Date" else [self.sort_column, "Date", "Time"]
+        self.view = self.view.sort_values(keys, ascending=self.sort_ascending, kind="mergesort")
@@ -4,6 +4,7 @@ import numpy as np
 from ultralytics import YOLO
 import time
 import sys
+from camera_source import LatestFrameCapture
 
 def create_known_faces_dir():
     """Create known_faces directory if it doesn't exist"""
@@ -21,7 +22,7 @@ def capture_face():
     known_faces_dir = create_known_faces_dir()
     
     # Open webcam
-    cap = cv2.VideoCapture(0)
+    cap = LatestFrameCapture(0)
     if not cap.isOpened():
         print(" Error: Could not open webcam")
         return
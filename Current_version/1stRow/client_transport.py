@@ -0,0 +1,230 @@
+import json
+import threading
+import time
+import cv2
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+class RecognitionClient:
+    """Shared kiosk-side transport for the face API.
+
+    Frames are JPEG-encoded in memory (no temp file on the SD card) and all
+    requests go through one keep-alive requests.Session with a connection
+    pool, so consecutive uploads reuse the same TCP connection.
+    """
+
+    def __init__(self, jpeg_quality=85, pool_size=4):
+        self.jpeg_quality = jpeg_quality
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.last_timings = {"encode_ms": 0.0, "upload_ms": 0.0, "bytes": 0}
+        self.avg_timings = {"encode_ms": 0.0, "upload_ms": 0.0}
+
+    def encode(self, frame):
+        """JPEG-encode a BGR frame in memory"""
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+        return buffer.tobytes()
+
+    def _record(self, encode_s, upload_s, size):
+        self.last_timings = {"encode_ms": round(encode_s * 1000, 1),
+                             "upload_ms": round(upload_s * 1000, 1),
+                             "bytes": size}
+        for key in ("encode_ms", "upload_ms"):
+            # Exponential moving average for display
+            self.avg_timings[key] = round(0.8 * self.avg_timings[key] + 0.2 * self.last_timings[key], 1)
+
+    def post_frame(self, url, frame, timeout=10, data=None, params=None):
+        """Encode and POST one frame as the "file" part; returns the response"""
+        start = time.perf_counter()
+        jpeg = self.encode(frame)
+        encoded = time.perf_counter()
+        try:
+            return self.post_jpeg(url, jpeg, timeout=timeout, data=data, params=params)
+        finally:
+            self._record(encoded - start, time.perf_counter() - encoded, len(jpeg))
+
+    def post_jpeg(self, url, jpeg, timeout=10, data=None, params=None, filename="frame.jpg"):
+        files = {"file": (filename, jpeg, "image/jpeg")}
+        return self.session.post(url, files=files, data=data, params=params, timeout=timeout)
+
+    def post_crops(self, url, crops, boxes, timeout=10, data=None):
+        """Encode face crops and POST them as "files" parts with their full-frame boxes"""
+        start = time.perf_counter()
+        jpegs = [self.encode(crop) for crop in crops]
+        encoded = time.perf_counter()
+        files = [("files", (f"face{i}.jpg", jpeg, "image/jpeg")) for i, jpeg in enumerate(jpegs)]
+        form = dict(data or {}, boxes=json.dumps(boxes))
+        try:
+            return self.session.post(url, files=files, data=form, timeout=timeout)
+        finally:
+            self._record(encoded - start, time.perf_counter() - encoded, sum(len(j) for j in jpegs))
+
+    def timings_text(self):
+        return (f"Encode: {self.avg_timings['encode_ms']} ms, "
+                f"Upload: {self.avg_timings['upload_ms']} ms, "
+                f"Last frame: {self.last_timings['bytes'] // 1024} KB")
+
+class LiveUploader:
+    """The kiosks' live upload path, shared by the API, Pi and CM5 GUIs.
+
+    One call takes a frame through the upload rate and motion gate, the
+    ROI crop (or an on-device detector's face crops), the POST and the
+    rate controller's feedback. While the API is unreachable the upload
+    goes to the offline queue instead, with the frame's capture time;
+    full frames only while the scene is moving or when forced.
+    """
+
+    def __init__(self, client, rate, motion_gate, cropper, uploader, frame_url, client_id,
+                 crops_url=None, timeout=15):
+        self.client = client
+        self.rate = rate
+        self.motion_gate = motion_gate
+        self.cropper = cropper
+        self.uploader = uploader
+        self.frame_url = frame_url
+        self.crops_url = crops_url
+        self.client_id = client_id
+        self.timeout = timeout
+        self.detector_lock = threading.Lock()
+
+    def upload(self, frame, captured_at, force=False, rate_acquired=False, detector=None):
+        """Recognized faces for the frame, or None if it was skipped, failed or queued.
+
+        `force` (a recognition requested on the kiosk) bypasses the rate and
+        motion gate; `rate_acquired` skips the rate check for callers that
+        already waited for their slot. With a `detector`, only its face
+        crops are uploaded, to crops_url.
+        """
+        if not force:
+            if not rate_acquired and not self.rate.try_acquire():
+                return None
+            if not self.motion_gate.should_upload(frame):
+                return None
+        if detector is not None:
+            with self.detector_lock:
+                boxes = detector.detect(frame)
+            # The ROI is applied here, where the frame size is known, before anything is cut out
+            boxes = [box for box in boxes if self.cropper.contains(box, frame)]
+            if not boxes:
+                return []
+            upload = ("crops", [detector.crop(frame, box) for box in boxes], boxes)
+        else:
+            image, crop_fields = self.cropper.prepare(frame)
+            upload = ("frame", image, crop_fields)
+        if self.uploader.online:
+            start = time.perf_counter()
+            try:
+                response = self._send(upload)
+            except requests.RequestException as e:
+                print(f"[DEBUG] API unreachable, queueing upload: {e}")
+                self.rate.on_failure()
+                self.uploader.report_failure()
+            else:
+                self.rate.on_response(response.status_code, time.perf_counter() - start,
+                                      response.headers.get("Retry-After"))
+                if response.status_code != 200:
+                    return None
+                recognized = response.json().get("recognized", [])
+                if upload[0] == "frame":
+                    self.cropper.observe([p.get("box") for p in recognized])
+                return recognized
+        self._queue(upload, captured_at, force)
+        return None
+
+    def _send(self, upload):
+        kind, payload, extra = upload
+        if kind == "crops":
+            return self.client.post_crops(self.crops_url, payload, extra, timeout=self.timeout,
+                                          data={"client_id": self.client_id})
+        return self.client.post_frame(self.frame_url, payload, timeout=self.timeout,
+                                      data={"client_id": self.client_id, **extra})
+
+    def _queue(self, upload, captured_at, force):
+        """Keep an upload for the offline drain so no attendance event is lost"""
+        kind, payload, extra = upload
+        if kind == "crops":
+            self.uploader.enqueue_crops([self.client.encode(crop) for crop in payload], extra, captured_at)
+        elif force or self.motion_gate.moving(captured_at):
+            self.uploader.enqueue_frame(self.client.encode(payload), captured_at, extra)
+
+    def status_text(self):
+        return (f"{self.client.timings_text()}, {self.motion_gate.stats_text()}, "
+                f"{self.rate.status_text()}, {self.uploader.status_text()}")
+
+ROI_FRAME_SIZE = [2560, 1440]  # Camera resolution an ROI file was drawn at, unless it records its own
+
+def load_roi_points(filename="roi_config_first_row.json"):
+    """(ROI points, [width, height] of the frame they were drawn on); points are None without a file"""
+    try:
+        with open(filename, "r") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None, ROI_FRAME_SIZE
+    return data["roi"], data.get("frame_size", ROI_FRAME_SIZE)
+
+class RoiCropper:
+    """Crops frames to the ROI's bounding rectangle and downscales before upload.
+
+    The ROI is scaled from the resolution it was drawn at to each camera's
+    frame size, once per size. The upload scale follows the faces the
+    server returns so that a typical face arrives at about
+    `target_face_px` pixels high. The offset, scale and frame size are
+    sent as form fields so the server can map boxes back to the frame and
+    scale its own copy of the ROI the same way.
+    """
+
+    def __init__(self, roi_points, roi_frame_size=ROI_FRAME_SIZE, target_face_px=112, min_scale=0.25):
+        self.points = np.array(roi_points, np.float32) if roi_points else None
+        self.roi_frame_size = roi_frame_size
+        self.target_face_px = target_face_px
+        self.min_scale = min_scale
+        self.scale = 1.0
+        self.frame_shape = None
+        self.polygon = None
+        self.rect = None
+
+    def _fit(self, shape):
+        """Scale the ROI polygon and its bounding rectangle to frames of this shape"""
+        polygon = rect = None
+        if self.points is not None:
+            polygon = self.points * (shape[1] / float(self.roi_frame_size[0]), shape[0] / float(self.roi_frame_size[1]))
+            x, y, w, h = cv2.boundingRect(np.round(polygon).astype(np.int32))
+            x, y = max(0, x), max(0, y)
+            rect = (x, y, min(w, shape[1] - x), min(h, shape[0] - y))
+        self.polygon, self.rect, self.frame_shape = polygon, rect, shape
+
+    def prepare(self, frame):
+        """Returns (image to upload, metadata form fields)"""
+        if frame.shape[:2] != self.frame_shape:
+            self._fit(frame.shape[:2])
+        if self.rect is None:
+            return frame, {}
+        x, y, w, h = self.rect
+        image = frame[y:y + h, x:x + w]
+        if self.scale < 1.0:
+            image = cv2.resize(image, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return image, {"offset_x": x, "offset_y": y, "scale": round(self.scale, 4),
+                       "frame_width": frame.shape[1], "frame_height": frame.shape[0]}
+
+    def contains(self, box, frame):
+        """True if a full-frame box passes the ROI gate (its top-left corner, as on the server)"""
+        if frame.shape[:2] != self.frame_shape:
+            self._fit(frame.shape[:2])
+        if self.polygon is None:
+            return True
+        return cv2.pointPolygonTest(self.polygon, (float(box[0]), float(box[1])), False) >= 0
+
+    def observe(self, boxes):
+        """Adapt the scale to the full-frame face boxes of the last response"""
+        heights = [box[3] - box[1] for box in boxes if box and len(box) == 4]
+        if heights:
+            scale = self.target_face_px / float(np.median(heights))
+        else:
+            # Nobody found: relax towards full resolution so small faces are not lost
+            scale = self.scale * 1.25
+        self.scale = min(1.0, max(self.min_scale, scale))
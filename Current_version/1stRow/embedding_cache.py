@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+import cv2
+import numpy as np
+
+def perceptual_hash(face_crop, hash_size=16):
+    """Difference hash (hash_size**2 bits) of a downscaled grayscale face crop"""
+    gray = cv2.cvtColor(face_crop, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return np.packbits(small[:, 1:] > small[:, :-1]).tobytes()
+
+def hamming(a, b):
+    """Number of differing bits between two hashes held as ints"""
+    return bin(a ^ b).count("1")
+
+class EmbeddingCache:
+    """Bounded LRU of face embeddings looked up by box position and perceptual hash.
+
+    Kiosk frames of a seated person are nearly identical between polls, so
+    the network can be skipped for their crops. The hash is taken of the
+    aligned network input (what the embedding is actually computed from)
+    at `hash_size`x`hash_size`. Detector jitter and JPEG noise flip a few
+    of its bits, so a lookup takes the entry with the nearest hash among
+    those whose box is within `box_quantum` pixels on every side, and hits
+    only below `max_distance` bits: a different person in the same seat
+    differs in far more bits and misses. Entries expire after `ttl`
+    seconds so a changed face is re-embedded.
+    """
+
+    def __init__(self, max_size=512, ttl=10.0, box_quantum=16, hash_size=16, max_distance=24):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.box_quantum = box_quantum
+        self.hash_size = hash_size
+        self.max_distance = max_distance
+        self.entries = OrderedDict()  # entry id -> (hash, box, embedding, stored at)
+        self.cells = {}  # box centre cell -> ids of the entries there
+        self.next_id = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, aligned_face, box):
+        """Key for an align_face() output and its full-frame box"""
+        return int.from_bytes(perceptual_hash(aligned_face, self.hash_size), "big"), tuple(int(v) for v in box)
+
+    def _cell(self, box):
+        q = self.box_quantum
+        return (box[0] + box[2]) // 2 // q, (box[1] + box[3]) // 2 // q
+
+    def _remove(self, entry_id):
+        face_hash, box, embedding, stored_at = self.entries.pop(entry_id)
+        cell = self._cell(box)
+        self.cells[cell].discard(entry_id)
+        if not self.cells[cell]:
+            del self.cells[cell]
+
+    def get(self, key, now=None):
+        now = time.time() if now is None else now
+        face_hash, box = key
+        cx, cy = self._cell(box)
+        best_id, best_distance = None, self.max_distance
+        with self.lock:
+            expired = []
+            # A box within box_quantum on every side has its centre in this or a neighbouring cell
+            for cell in ((cx + dx, cy + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)):
+                for entry_id in self.cells.get(cell, ()):
+                    entry_hash, entry_box, _, stored_at = self.entries[entry_id]
+                    if now - stored_at > self.ttl:
+                        expired.append(entry_id)
+                        continue
+                    if max(abs(a - b) for a, b in zip(box, entry_box)) > self.box_quantum:
+                        continue
+                    distance = hamming(face_hash, entry_hash)
+                    if distance < best_distance:
+                        best_id, best_distance = entry_id, distance
+            for entry_id in expired:
+                self._remove(entry_id)
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(best_id)
+            self.hits += 1
+            return self.entries[best_id][2]
+
+    def put(self, key, embedding, now=None):
+        now = time.time() if now is None else now
+        face_hash, box = key
+        with self.lock:
+            self.next_id += 1
+            self.entries[self.next_id] = (face_hash, box, embedding, now)
+            self.cells.setdefault(self._cell(box), set()).add(self.next_id)
+            while len(self.entries) > self.max_size:
+                self._remove(next(iter(self.entries)))
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "size": len(self.entries)
+            }
@@ -1,15 +1,27 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, Response
 import cv2
 import numpy as np
 import json
 import os
-import pandas as pd
 from ultralytics import YOLO
-from deepface import DeepFace
-from datetime import datetime, timedelta
+from gallery_index import GalleryIndex
+from inference_pool import InferencePool, PoolFullError
+from attendance_ledger import AttendanceLedger, COLUMNS
+from face_tracker import TrackerRegistry
+from embedding_cache import EmbeddingCache
+from face_quality import score_faces, weakest_component
+from metrics import Counter, Histogram, new_request_stats, timed, count, render_all
 import pytz
 import logging
 import time
+import threading
+import gzip
+import hashlib
+import io
+import csv
+import struct
+import re
+from datetime import datetime
 
 app = Flask(__name__)
 
@@ -25,189 +37,858 @@ def load_config(config_file="recognition_config.json"):
                 "max_distance": 0.6,
                 "min_face_size": 50,
                 "consecutive_frames": 3,
-                "quality_threshold": 0.3,
+                "quality_threshold": 0.2,
                 "high_confidence_threshold": 0.6,
                 "history_length": 10,
                 "consistency_check_frames": 5
+            },
+            "server": {
+                "workers": 0,
+                "max_queue": 8,
+                "retry_after": 2
+            },
+            "tracking": {
+                "iou_threshold": 0.3,
+                "centroid_threshold": 0.5,
+                "max_age": 2.0,
+                "reverify_interval": 5.0,
+                "unknown_retry_interval": 1.0,
+                "session_ttl": 300
+            },
+            "embedding_cache": {
+                "max_size": 512,
+                "ttl": 10.0,
+                "max_hash_distance": 24
             }
         }
 
+ROI_FRAME_SIZE = [2560, 1440]  # Camera resolution an ROI file was drawn at, unless it records its own
+
 def load_roi(filename="roi_config_first_row.json"):
+    """(ROI polygon, [width, height] of the frame it was drawn on); the polygon is None without a file"""
     try:
         with open(filename, "r") as f:
             data = json.load(f)
-            return np.array(data["roi"], np.int32)
+            return np.array(data["roi"], np.int32), data.get("frame_size", ROI_FRAME_SIZE)
     except FileNotFoundError:
-        return None
+        return None, ROI_FRAME_SIZE
 
 config = load_config()
 face_config = config["face_recognition"]
-polygon_roi = load_roi()
-polygon_roi = None  # Disable ROI check for all faces
-model = YOLO("yolov11n-face.pt")
+polygon_roi, roi_frame_size = load_roi()  # Only tested for uploads that carry crop metadata
+scaled_rois = {}
+server_config = {"workers": 0, "max_queue": 8, "retry_after": 2}
+server_config.update(config.get("server", {}))
+tracking_config = {"iou_threshold": 0.3, "centroid_threshold": 0.5, "max_age": 2.0, "reverify_interval": 5.0,
+                   "unknown_retry_interval": 1.0, "session_ttl": 300}
+tracking_config.update(config.get("tracking", {}))
+trackers = TrackerRegistry(
+    session_ttl=tracking_config["session_ttl"],
+    iou_threshold=tracking_config["iou_threshold"],
+    centroid_threshold=tracking_config["centroid_threshold"],
+    max_age=tracking_config["max_age"]
+)
+cache_config = {"max_size": 512, "ttl": 10.0, "max_hash_distance": 24}
+cache_config.update(config.get("embedding_cache", {}))
+# Per process: each inference worker keeps its own cache next to its model
+embedding_cache = EmbeddingCache(max_size=cache_config["max_size"], ttl=cache_config["ttl"],
+                                 max_distance=cache_config["max_hash_distance"])
+
+# --- Metrics (aggregated in the API process, exported on /metrics) ---
+STAGE_SECONDS = Histogram("face_api_stage_seconds", "Time spent per pipeline stage", "stage")
+FACES_DETECTED = Counter("face_api_faces_detected_total", "Faces returned by the detector")
+FACES_REJECTED = Counter("face_api_faces_rejected_total", "Faces rejected per gate", "gate")
+PREVIEW_FACES_DETECTED = Counter("face_api_preview_faces_detected_total", "Faces returned by the /detect preview endpoint")
+FACES_RECOGNIZED = Counter("face_api_faces_recognized_total", "Faces matched to a known person")
+REQUESTS_REJECTED = Counter("face_api_requests_rejected_total", "Requests answered 503 because the queue was full")
+ALL_METRICS = [STAGE_SECONDS, FACES_DETECTED, PREVIEW_FACES_DETECTED, FACES_REJECTED, FACES_RECOGNIZED,
+               REQUESTS_REJECTED]
+
+def record_stats(stats):
+    """Fold a worker's per-request stats into the process-wide metrics"""
+    for stage, seconds in stats.get("stage_seconds", {}).items():
+        STAGE_SECONDS.observe(stage, seconds)
+    for name, amount in stats.get("gate_counts", {}).items():
+        if name == "detected":
+            FACES_DETECTED.inc(amount)
+        elif name == "preview_detected":
+            # /detect previews never reach the gates, so keep them out of the pipeline count
+            PREVIEW_FACES_DETECTED.inc(amount)
+        else:
+            FACES_REJECTED.inc(amount, name)
 KNOWN_FACES_DIR = "known_faces"
+ENROLL_NAME = re.compile(r"\w+")  # Gallery names come from file names, so no dots or separators
+enroll_lock = threading.Lock()
 os.makedirs(KNOWN_FACES_DIR, exist_ok=True)
+
+# Models are loaded per inference worker (see load_models / get_pool)
+model = None
+gallery = None
+pool = None
+pool_lock = threading.Lock()
+
+def load_models():
+    """Load YOLO and the gallery index into this process"""
+    global model, gallery
+    if model is None:
+        model = YOLO("yolov11n-face.pt")
+    if gallery is None:
+        gallery = GalleryIndex(KNOWN_FACES_DIR).build()
+
+def get_pool():
+    """Create the inference pool on first use"""
+    global pool
+    with pool_lock:
+        if pool is None:
+            pool = InferencePool(
+                workers=server_config["workers"],
+                max_queue=server_config["max_queue"],
+                initializer=load_models
+            )
+    return pool
+
 attendance_file = "attendance.csv"
+ATTENDANCE_TZ = pytz.timezone('Asia/Kolkata')
+ledger = None
+ledger_lock = threading.Lock()
+
+def get_ledger():
+    """Open the attendance ledger on first use (API process only)"""
+    global ledger
+    with ledger_lock:
+        if ledger is None:
+            ledger = AttendanceLedger(attendance_file, tz=ATTENDANCE_TZ)
+    return ledger
 
 # --- Attendance marking logic ---
-def mark_attendance(name):
-    ist = pytz.timezone('Asia/Kolkata')
-    now = datetime.now(ist)
-    current_time = now.strftime("%H:%M:%S")
-    today_date = now.strftime("%Y-%m-%d")
-    required_columns = ["Name", "Date", "Time", "Type"]
-    recreate_file = False
-    if not os.path.exists(attendance_file):
-        recreate_file = True
-    else:
-        try:
-            df = pd.read_csv(attendance_file)
-            if list(df.columns) != required_columns:
-                recreate_file = True
-        except Exception:
-            recreate_file = True
-    if recreate_file:
-        pd.DataFrame({col: [] for col in required_columns}).to_csv(attendance_file, index=False)
-    df = pd.read_csv(attendance_file)
-    today_df = df[df["Date"] == today_date]
-    person_entries = today_df[today_df["Name"] == name]
-    if isinstance(person_entries, pd.DataFrame) and (person_entries.empty or (person_entries.iloc[-1]["Type"] == "out")):
-        new_entry = pd.DataFrame({
-            "Name": [name],
-            "Date": [today_date],
-            "Time": [current_time],
-            "Type": ["in"]
-        })
-        new_entry.to_csv(attendance_file, mode="a", header=False, index=False)
-        return "in"
-    if isinstance(person_entries, pd.DataFrame) and not person_entries.empty and person_entries.iloc[-1]["Type"] == "in":
-        last_in = person_entries.iloc[-1]
-        ist = pytz.timezone('Asia/Kolkata')
-        last_in_time = ist.localize(datetime.strptime(f"{last_in['Date']} {last_in['Time']}", "%Y-%m-%d %H:%M:%S"))
-        now = datetime.now(ist)
-        if (now - last_in_time) >= timedelta(hours=1):
-            new_entry = pd.DataFrame({
-                "Name": [name],
-                "Date": [today_date],
-                "Time": [current_time],
-                "Type": ["out"]
-            })
-            new_entry.to_csv(attendance_file, mode="a", header=False, index=False)
-            return "out"
-        else:
-            return "already_marked"
-    return "already_marked"
+def mark_attendance(name, when=None):
+    start = time.perf_counter()
+    attendance_status = get_ledger().mark(name, when)
+    STAGE_SECONDS.observe("attendance_write", time.perf_counter() - start)
+    return attendance_status
 
 def is_inside_polygon(x, y, polygon):
     if polygon is None:
         return True
-    return cv2.pointPolygonTest(polygon, (x, y), False) >= 0
+    return cv2.pointPolygonTest(polygon, (float(x), float(y)), False) >= 0
 
-def get_face_quality_score(face_crop):
-    if face_crop.size == 0:
-        return 0
-    try:
-        gray = cv2.cvtColor(face_crop, cv2.COLOR_BGR2GRAY)
-        laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
-        brightness = np.mean(gray)
-        sharpness_score = min(laplacian_var / 100, 1.0)
-        brightness_score = 1.0 - abs(brightness - 128) / 128
-        return (sharpness_score + brightness_score) / 2
-    except Exception:
-        return 0
-
-def get_best_match_from_deepface_result(result):
-    if isinstance(result, pd.DataFrame) and not result.empty:
-        return result.iloc[0]
-    return None
-
-def recognize_face_with_confidence(face_crop):
-    quality_score = get_face_quality_score(face_crop)
-    print(f"[DEBUG] Face quality score: {quality_score}")
-    if quality_score < face_config["quality_threshold"]:
-        print("[DEBUG] Low quality face, skipping.")
-        return None, 0, f"Low quality face ({quality_score:.2f})"
-    verification = DeepFace.find(
-        img_path=face_crop,
-        db_path=KNOWN_FACES_DIR,
-        model_name="ArcFace",
-        enforce_detection=False
-    )
-    print(f"[DEBUG] DeepFace.find result: {verification}")
-    if isinstance(verification, list) and len(verification) > 0:
-        best_match = get_best_match_from_deepface_result(verification[0])
-        print(f"[DEBUG] DeepFace best match: {best_match}")
-        if best_match is not None:
-            distance = best_match["distance"]
-            person_name = os.path.basename(best_match["identity"]).split(".")[0]
-            if distance <= face_config["max_distance"]:
-                confidence = 1.0 - (distance / face_config["max_distance"])
-                status = f"Distance: {distance:.3f}, Quality: {quality_score:.2f}"
-                return person_name, confidence, status
-            else:
-                print(f"[DEBUG] Distance too high: {distance}")
-                return None, 0, f"Distance too high: {distance:.3f}"
-        else:
-            print("[DEBUG] No match found in DeepFace result.")
-            return None, 0, "No match found"
-    else:
-        print("[DEBUG] No match found by DeepFace.")
+def roi_for_frame(frame_size):
+    """polygon_roi in pixels of a frame_size ([width, height]) frame; as drawn when frame_size is None"""
+    if polygon_roi is None or frame_size is None:
+        return polygon_roi
+    key = (int(frame_size[0]), int(frame_size[1]))
+    if key not in scaled_rois:
+        if len(scaled_rois) >= 16:
+            scaled_rois.clear()
+        scale = (key[0] / float(roi_frame_size[0]), key[1] / float(roi_frame_size[1]))
+        scaled_rois[key] = (polygon_roi * scale).astype(np.float32)
+    return scaled_rois[key]
+
+def match_face(person_name, identity, distance, quality_score):
+    print(f"[DEBUG] Gallery best match: {identity} distance={distance}")
+    if person_name is None:
+        print("[DEBUG] No match found in gallery.")
         return None, 0, "No match found"
+    if distance <= face_config["max_distance"]:
+        confidence = 1.0 - (distance / face_config["max_distance"])
+        status = f"Distance: {distance:.3f}, Quality: {quality_score:.2f}"
+        return person_name, confidence, status
+    else:
+        print(f"[DEBUG] Distance too high: {distance}")
+        return None, 0, f"Distance too high: {distance:.3f}"
+
+def to_frame_box(box, transform):
+    """Map a box from an uploaded ROI crop back to full-frame coordinates"""
+    offset_x, offset_y, scale = transform[:3]
+    x1, y1, x2, y2 = box
+    return [int(round(offset_x + x1 / scale)), int(round(offset_y + y1 / scale)),
+            int(round(offset_x + x2 / scale)), int(round(offset_y + y2 / scale))]
+
+def detect_faces(img, stats, transform=None):
+    """Run YOLO and keep the boxes that pass the confidence, size and ROI gates"""
+    return detect_faces_batch([img], stats, [transform])[0]
+
+def detect_faces_batch(imgs, stats, transforms=None):
+    """Run YOLO once on a list of frames; returns the gated candidates per frame"""
+    transforms = transforms or [None] * len(imgs)
+    with timed(stats, "detection"):
+        results = model(imgs)
+    print(f"[DEBUG] YOLO results: {len(results)} result(s)")
+    return [gate_detections(img, result, stats, transform)
+            for img, result, transform in zip(imgs, results, transforms)]
+
+def gate_detections(img, result, stats, transform=None):
+    """Apply the confidence, size and ROI gates to one frame's YOLO result.
+
+    `transform` is the (offset_x, offset_y, scale[, frame_width,
+    frame_height]) of a client-side ROI crop. Returned boxes and the size
+    and ROI gates then use the kiosk's full-frame coordinates, with the ROI
+    scaled to its frame size; the ROI gate is skipped for plain full-frame
+    uploads, whose resolution is unknown.
+    """
+    candidates = []
+    print(f"[DEBUG] YOLO result: {len(result.boxes)} box(es)")
+    count(stats, "detected", len(result.boxes))
+    for box in result.boxes:
+        x1, y1, x2, y2 = map(int, box.xyxy[0])
+        confidence = box.conf[0].item()
+        print(f"[DEBUG] Detected box: {x1},{y1},{x2},{y2} conf={confidence}")
+        if confidence < face_config["min_confidence"]:
+            print(f"[DEBUG] Skipping box due to low confidence: {confidence}")
+            count(stats, "confidence")
+            continue
+        frame_box = to_frame_box((x1, y1, x2, y2), transform) if transform else [x1, y1, x2, y2]
+        face_width = frame_box[2] - frame_box[0]
+        face_height = frame_box[3] - frame_box[1]
+        if face_width < face_config["min_face_size"] or face_height < face_config["min_face_size"]:
+            print(f"[DEBUG] Skipping box due to small size: {face_width}x{face_height}")
+            count(stats, "size")
+            continue
+        if transform and not is_inside_polygon(frame_box[0], frame_box[1], roi_for_frame(transform[3:] or None)):
+            print(f"[DEBUG] Skipping box outside ROI")
+            count(stats, "roi")
+            continue
+        face_crop = img[y1:y2, x1:x2]
+        if face_crop.size == 0:
+            print(f"[DEBUG] Skipping empty face crop")
+            count(stats, "size")
+            continue
+        candidates.append({
+            "box": frame_box,
+            "crop": face_crop
+        })
+    return candidates
+
+def recognize_faces(candidates, stats):
+    """Quality-gate the candidates, embed the survivors in one batch and match them.
+
+    Returns one (name, confidence, status) tuple per candidate, in order.
+    """
+    gallery.reload_if_changed()
+    outcomes = [None] * len(candidates)
+    batch_indices, batch_quality, batch_keys = [], [], []
+    embeddings, aligned = {}, {}
+    with timed(stats, "quality"):
+        quality_scores, quality_parts = score_faces([c["crop"] for c in candidates], face_config["min_face_size"])
+    for i, candidate in enumerate(candidates):
+        quality_score = float(quality_scores[i])
+        print(f"[DEBUG] Face quality score: {quality_score:.2f}")
+        if quality_score < face_config["quality_threshold"]:
+            weakest, value = weakest_component(quality_parts, i)
+            print(f"[DEBUG] Low quality face ({weakest} {value:.2f}), skipping.")
+            count(stats, "quality")
+            outcomes[i] = (None, 0, f"Low quality face ({quality_score:.2f}, {weakest} {value:.2f})")
+            continue
+        # The cache is keyed on the network input itself, not the raw detector crop
+        aligned[i] = gallery.align(candidate["crop"])
+        key = embedding_cache.key(aligned[i], candidate["box"])
+        cached = embedding_cache.get(key)
+        if cached is not None:
+            embeddings[i] = cached
+        batch_indices.append(i)
+        batch_quality.append(quality_score)
+        batch_keys.append(key)
+    misses = [(i, key) for i, key in zip(batch_indices, batch_keys) if i not in embeddings]
+    if misses:
+        with timed(stats, "embedding"):
+            fresh = gallery.embed_aligned([aligned[i] for i, _ in misses])
+        for (i, key), embedding in zip(misses, fresh):
+            embedding_cache.put(key, embedding)
+            embeddings[i] = embedding
+    if batch_indices:
+        with timed(stats, "gallery_search"):
+            matches = gallery.search_batch(np.stack([embeddings[i] for i in batch_indices]))
+        for i, (person_name, identity, distance), quality_score in zip(batch_indices, matches, batch_quality):
+            outcomes[i] = match_face(person_name, identity, distance, quality_score)
+            if outcomes[i][0] is None and distance is not None:
+                count(stats, "distance")
+    return outcomes
+
+def decode_image(image_bytes, stats):
+    with timed(stats, "decode"):
+        img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    print(f"[DEBUG] Image loaded, shape: {img.shape if img is not None else None}")
+    return img
+
+def process_image(image_bytes, transform=None):
+    """Decode, detect and recognize one uploaded frame (runs on an inference worker)"""
+    stats = new_request_stats()
+    img = decode_image(image_bytes, stats)
+    if img is None:
+        return None, stats
+    candidates = detect_faces(img, stats, transform)
+    outcomes = recognize_faces(candidates, stats)
+    faces = [
+        {"box": candidate["box"], "name": person_name, "recognition_confidence": recog_conf, "status": status}
+        for candidate, (person_name, recog_conf, status) in zip(candidates, outcomes)
+    ]
+    stats["embedding_cache"] = embedding_cache.stats()
+    return faces, stats
+
+def process_images(images_bytes, transforms=None):
+    """Recognize several frames with one YOLO call and one ArcFace batch.
+
+    Returns a list with, per frame, its faces or None if it did not decode.
+    """
+    stats = new_request_stats()
+    transforms = transforms or [None] * len(images_bytes)
+    imgs = [decode_image(image_bytes, stats) for image_bytes in images_bytes]
+    valid = [i for i, img in enumerate(imgs) if img is not None]
+    per_frame = detect_faces_batch([imgs[i] for i in valid], stats, [transforms[i] for i in valid]) if valid else []
+    flat = [(i, candidate) for i, candidates in zip(valid, per_frame) for candidate in candidates]
+    outcomes = recognize_faces([candidate for _, candidate in flat], stats)
+    frames = [None] * len(imgs)
+    for i in valid:
+        frames[i] = []
+    for (i, candidate), (person_name, recog_conf, status) in zip(flat, outcomes):
+        frames[i].append({"box": candidate["box"], "name": person_name,
+                          "recognition_confidence": recog_conf, "status": status})
+    stats["embedding_cache"] = embedding_cache.stats()
+    return frames, stats
+
+def detect_candidates(image_bytes, transform=None):
+    """Decode and detect only; the crops are returned for a later recognize_crops call"""
+    stats = new_request_stats()
+    img = decode_image(image_bytes, stats)
+    if img is None:
+        return None, stats
+    return detect_faces(img, stats, transform), stats
+
+def recognize_crops(candidates):
+    """Embed and match already detected crops (runs on an inference worker)"""
+    stats = new_request_stats()
+    outcomes = recognize_faces(candidates, stats)
+    stats["embedding_cache"] = embedding_cache.stats()
+    return outcomes, stats
+
+def recognize_crop_images(crops_bytes, boxes=None):
+    """Decode face crops detected on the kiosk and recognize them (runs on an inference worker).
+
+    `boxes` are the crops' full-frame boxes as reported by the client; a
+    crop without one gets its own extent. Crops that do not decode are
+    dropped.
+    """
+    stats = new_request_stats()
+    candidates = []
+    for i, crop_bytes in enumerate(crops_bytes):
+        crop = decode_image(crop_bytes, stats)
+        if crop is None or crop.size == 0:
+            continue
+        box = boxes[i] if boxes and i < len(boxes) else [0, 0, crop.shape[1], crop.shape[0]]
+        candidates.append({"box": [int(v) for v in box], "crop": crop, "index": i})
+    outcomes = recognize_faces(candidates, stats)
+    faces = [
+        {"box": candidate["box"], "name": person_name, "recognition_confidence": recog_conf,
+         "status": status, "index": candidate["index"]}
+        for candidate, (person_name, recog_conf, status) in zip(candidates, outcomes)
+    ]
+    stats["embedding_cache"] = embedding_cache.stats()
+    return faces, stats
+
+def enroll_face(name, image_bytes, replace=False):
+    """Embed an uploaded face crop once and add it to the gallery (runs on an inference worker)"""
+    stats = new_request_stats()
+    img = decode_image(image_bytes, stats)
+    if img is None:
+        return None, stats
+    with timed(stats, "enroll"):
+        path = gallery.add(name, img, replace)
+    return {"name": name, "identity": path, "gallery_size": len(gallery)}, stats
+
+def unenroll_face(name):
+    """Remove every gallery image of name (runs on an inference worker)"""
+    stats = new_request_stats()
+    with timed(stats, "enroll"):
+        removed = gallery.remove(name)
+    return {"name": name, "removed": removed, "gallery_size": len(gallery)}, stats
+
+def detect_image(image_bytes, max_side=None):
+    """YOLO-only detection for preview loops, optionally on a downscaled copy"""
+    stats = new_request_stats()
+    img = decode_image(image_bytes, stats)
+    if img is None:
+        return None, stats
+    scale = 1.0
+    if max_side and max(img.shape[:2]) > max_side:
+        scale = max_side / max(img.shape[:2])
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    faces = []
+    with timed(stats, "detection"):
+        results = model(img)
+    for result in results:
+        count(stats, "preview_detected", len(result.boxes))
+        for box in result.boxes:
+            confidence = box.conf[0].item()
+            if confidence < face_config["min_confidence"]:
+                continue
+            x1, y1, x2, y2 = (int(v / scale) for v in box.xyxy[0].tolist())
+            faces.append({"box": [x1, y1, x2, y2], "confidence": confidence})
+    return faces, stats
+
+def busy_response(error):
+    REQUESTS_REJECTED.inc()
+    response = jsonify({'error': str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(server_config["retry_after"])
+    return response
+
+def recognize_tracked(image_bytes, client_id, transform=None):
+    """Recognize a frame reusing per-client face tracks.
+
+    Faces that continue an existing track keep its identity and are only
+    re-embedded on the reverify schedule, or every frame while the match
+    is shaky (below high_confidence_threshold).
+    """
+    worker_pool = get_pool()
+    (candidates, detect_stats), queue_stats = worker_pool.run(detect_candidates, image_bytes, transform)
+    record_stats(detect_stats)
+    worker_stats = {}
+    if candidates is None:
+        return None, queue_stats, worker_stats, None
+    tracker = trackers.get(client_id)
+    now = time.time()
+    with tracker.lock:
+        tracks = tracker.update([c["box"] for c in candidates], now)
+        stale = [i for i, track in enumerate(tracks) if track.needs_verification(
+            now,
+            tracking_config["reverify_interval"],
+            tracking_config["unknown_retry_interval"],
+            face_config["high_confidence_threshold"]
+        )]
+    if stale:
+        (outcomes, worker_stats), embed_stats = worker_pool.run(recognize_crops, [candidates[i] for i in stale])
+        record_stats(worker_stats)
+        queue_stats["wait_ms"] = round(queue_stats["wait_ms"] + embed_stats["wait_ms"], 1)
+        with tracker.lock:
+            for i, (person_name, recog_conf, status) in zip(stale, outcomes):
+                tracks[i].record(person_name, recog_conf, status, now)
+    faces = [
+        {"box": track.box, "name": track.name, "recognition_confidence": track.confidence,
+         "status": track.status, "track_id": track.track_id}
+        for track in tracks
+    ]
+    tracking_stats = {"embedded": len(stale), "reused": len(tracks) - len(stale)}
+    return faces, queue_stats, worker_stats, tracking_stats
+
+def recognize_crops_tracked(crops_bytes, boxes, client_id):
+    """Recognize kiosk-detected crops reusing per-client face tracks.
+
+    The kiosk's boxes feed the tracker like recognize_tracked's detections,
+    so only crops whose track needs (re-)verification are decoded and
+    embedded. Faces carry the index of their crop; a track whose crop did
+    not decode and that was never recognized is left out.
+    """
+    worker_pool = get_pool()
+    tracker = trackers.get(client_id)
+    now = time.time()
+    with tracker.lock:
+        tracks = tracker.update([[int(v) for v in box] for box in boxes], now)
+        stale = [i for i, track in enumerate(tracks) if track.needs_verification(
+            now,
+            tracking_config["reverify_interval"],
+            tracking_config["unknown_retry_interval"],
+            face_config["high_confidence_threshold"]
+        )]
+    worker_stats = {}
+    queue_stats = {"depth": worker_pool.queue_depth(), "wait_ms": 0.0}
+    if stale:
+        (outcomes, worker_stats), queue_stats = worker_pool.run(
+            recognize_crop_images, [crops_bytes[i] for i in stale], [boxes[i] for i in stale])
+        record_stats(worker_stats)
+        with tracker.lock:
+            for face in outcomes:
+                tracks[stale[face["index"]]].record(face["name"], face["recognition_confidence"], face["status"], now)
+    faces = [
+        {"box": track.box, "name": track.name, "recognition_confidence": track.confidence,
+         "status": track.status, "track_id": track.track_id, "index": i}
+        for i, track in enumerate(tracks) if track.last_verified is not None
+    ]
+    tracking_stats = {"embedded": len(stale), "reused": len(tracks) - len(stale)}
+    return faces, queue_stats, worker_stats, tracking_stats
+
+def mark_recognized(faces):
+    """Mark attendance for matched faces and build the response entries"""
+    recognized = []
+    for face in faces:
+        person_name = face["name"]
+        print(f"[DEBUG] Recognition result: name={person_name}, conf={face['recognition_confidence']}, status={face['status']}")
+        if person_name:
+            FACES_RECOGNIZED.inc()
+            attendance_status = mark_attendance(person_name, face.get("captured_at"))
+        else:
+            attendance_status = None
+        entry = {
+            "name": person_name if person_name else "Unknown",
+            "box": face["box"],
+            "recognition_confidence": face["recognition_confidence"],
+            "status": face["status"],
+            "attendance": attendance_status
+        }
+        if "track_id" in face:
+            entry["track_id"] = face["track_id"]
+        recognized.append(entry)
+    return recognized
+
+def capture_time(epoch_seconds):
+    """Attendance time for an upload captured at epoch_seconds on the kiosk, or None for now"""
+    if epoch_seconds is None:
+        return None
+    now = datetime.now(ATTENDANCE_TZ)
+    # A kiosk clock running ahead must not create events in the future
+    return min(datetime.fromtimestamp(float(epoch_seconds), ATTENDANCE_TZ), now)
+
+def read_capture_times(n):
+    """Capture times of queued uploads, one per frame or crop.
+
+    The "captured_at" form field holds epoch seconds, either a single
+    number for all uploads or a JSON list with one entry (or null) each.
+    """
+    if 'captured_at' not in request.form:
+        return [None] * n
+    value = json.loads(request.form['captured_at'])
+    values = value if isinstance(value, list) else [value] * n
+    if len(values) != n:
+        raise ValueError("captured_at needs one entry per upload")
+    return [capture_time(v) for v in values]
+
+def read_frame_transform():
+    """(offset_x, offset_y, scale[, frame_width, frame_height]) form fields of an ROI-cropped upload, or None"""
+    if 'offset_x' not in request.form and 'offset_y' not in request.form and 'scale' not in request.form:
+        return None
+    offset_x = int(request.form.get('offset_x', 0))
+    offset_y = int(request.form.get('offset_y', 0))
+    scale = float(request.form.get('scale', 1.0))
+    if scale <= 0:
+        raise ValueError("scale must be positive")
+    frame_size = read_frame_size()
+    if frame_size is None:
+        return offset_x, offset_y, scale
+    return (offset_x, offset_y, scale) + tuple(frame_size)
+
+def read_frame_size():
+    """[frame_width, frame_height] form fields of the kiosk's frames, or None"""
+    if 'frame_width' not in request.form or 'frame_height' not in request.form:
+        return None
+    frame_size = [int(request.form['frame_width']), int(request.form['frame_height'])]
+    if frame_size[0] <= 0 or frame_size[1] <= 0:
+        raise ValueError("frame size must be positive")
+    return frame_size
+
+def read_crop_boxes(n):
+    """Full-frame boxes of a /recognize_crops upload: None, or one [x1, y1, x2, y2] (or null) per crop"""
+    if 'boxes' not in request.form:
+        return None
+    boxes = json.loads(request.form['boxes'])
+    if not isinstance(boxes, list) or len(boxes) != n:
+        raise ValueError("boxes needs one entry per crop")
+    for box in boxes:
+        if box is not None and (not isinstance(box, list) or len(box) != 4 or not all(
+                isinstance(v, (int, float)) and not isinstance(v, bool) for v in box)):
+            raise ValueError("each box must be null or [x1, y1, x2, y2]")
+    return boxes
+
+def parse_transform(entry):
+    """One "transforms" entry of a batch upload: None or (offset_x, offset_y, scale[, frame_width, frame_height])"""
+    if entry is None:
+        return None
+    if not isinstance(entry, list) or len(entry) not in (3, 5) or not all(
+            isinstance(v, (int, float)) and not isinstance(v, bool) for v in entry):
+        raise ValueError("each transform must be null or [offset_x, offset_y, scale(, frame_width, frame_height)]")
+    offset_x, offset_y, scale = int(entry[0]), int(entry[1]), float(entry[2])
+    if scale <= 0:
+        raise ValueError("scale must be positive")
+    if len(entry) == 3:
+        return offset_x, offset_y, scale
+    frame_width, frame_height = int(entry[3]), int(entry[4])
+    if frame_width <= 0 or frame_height <= 0:
+        raise ValueError("frame size must be positive")
+    return offset_x, offset_y, scale, frame_width, frame_height
 
 @app.route('/recognize', methods=['POST'])
 def recognize():
+    """Detect and recognize faces in an uploaded frame and mark attendance.
+
+    Send a client_id form field (or X-Client-Id header) to enable
+    server-side face tracking across calls from the same camera.
+    Clients that upload only the ROI's bounding rectangle, optionally
+    downscaled, send offset_x, offset_y and scale form fields; boxes are
+    then returned in full-frame coordinates and the ROI gate is applied,
+    scaled to the frame_width and frame_height fields when sent.
+    """
     print("[DEBUG] Received /recognize request")
     if 'file' not in request.files:
         print("[DEBUG] No file uploaded")
         return jsonify({'error': 'No file uploaded'}), 400
     file = request.files['file']
-    img_bytes = np.frombuffer(file.read(), np.uint8)
-    img = cv2.imdecode(img_bytes, cv2.IMREAD_COLOR)
-    print(f"[DEBUG] Image loaded, shape: {img.shape if img is not None else None}")
-    results = model(img)
-    print(f"[DEBUG] YOLO results: {len(results)} result(s)")
-    recognized = []
-    for result in results:
-        print(f"[DEBUG] YOLO result: {len(result.boxes)} box(es)")
-        for box in result.boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            confidence = box.conf[0].item()
-            print(f"[DEBUG] Detected box: {x1},{y1},{x2},{y2} conf={confidence}")
-            if confidence < face_config["min_confidence"]:
-                print(f"[DEBUG] Skipping box due to low confidence: {confidence}")
-                continue
-            face_width = x2 - x1
-            face_height = y2 - y1
-            if face_width < face_config["min_face_size"] or face_height < face_config["min_face_size"]:
-                print(f"[DEBUG] Skipping box due to small size: {face_width}x{face_height}")
-                continue
-            if not is_inside_polygon(x1, y1, polygon_roi):
-                print(f"[DEBUG] Skipping box outside ROI")
-                continue
-            face_crop = img[y1:y2, x1:x2]
-            if face_crop.size == 0:
-                print(f"[DEBUG] Skipping empty face crop")
-                continue
-            person_name, recog_conf, status = recognize_face_with_confidence(face_crop)
-            print(f"[DEBUG] DeepFace result: name={person_name}, conf={recog_conf}, status={status}")
-            if person_name:
-                attendance_status = mark_attendance(person_name)
-            else:
-                attendance_status = None
-            recognized.append({
-                "name": person_name if person_name else "Unknown",
-                "box": [int(x1), int(y1), int(x2), int(y2)],
-                "recognition_confidence": recog_conf,
-                "status": status,
-                "attendance": attendance_status
-            })
+    client_id = request.form.get('client_id') or request.headers.get('X-Client-Id')
+    try:
+        transform = read_frame_transform()
+        captured_at = read_capture_times(1)[0]
+    except ValueError as e:
+        return jsonify({'error': f'Invalid upload metadata: {e}'}), 400
+    tracking_stats = None
+    request_start = time.perf_counter()
+    try:
+        if client_id:
+            faces, queue_stats, worker_stats, tracking_stats = recognize_tracked(file.read(), client_id, transform)
+        else:
+            (faces, worker_stats), queue_stats = get_pool().run(process_image, file.read(), transform)
+            record_stats(worker_stats)
+        STAGE_SECONDS.observe("queue_wait", queue_stats["wait_ms"] / 1000.0)
+    except PoolFullError as e:
+        print(f"[DEBUG] Rejecting request: {e}")
+        return busy_response(e)
+    if faces is None:
+        return jsonify({'error': 'Could not decode image'}), 400
+    for face in faces:
+        face["captured_at"] = captured_at
+    recognized = mark_recognized(faces)
     print(f"[DEBUG] Returning {len(recognized)} recognized face(s)")
-    return jsonify({"recognized": recognized})
+    response = {"recognized": recognized, "queue": queue_stats}
+    if "embedding_cache" in worker_stats:
+        response["embedding_cache"] = worker_stats["embedding_cache"]
+    if tracking_stats is not None:
+        response["tracking"] = tracking_stats
+    STAGE_SECONDS.observe("request_total", time.perf_counter() - request_start)
+    return jsonify(response)
+
+def read_batch_frames():
+    """Frames of a /recognize_batch request, in upload order.
+
+    Either several multipart parts named "files" (or "file"), or an
+    application/octet-stream body of frames each prefixed by its length
+    as a 4-byte big-endian unsigned integer.
+    """
+    if request.files:
+        return [f.read() for f in request.files.getlist('files') + request.files.getlist('file')]
+    body = request.get_data()
+    frames, offset = [], 0
+    while offset < len(body):
+        if offset + 4 > len(body):
+            raise ValueError("Truncated length prefix")
+        (length,) = struct.unpack_from(">I", body, offset)
+        offset += 4
+        if offset + length > len(body):
+            raise ValueError("Truncated frame")
+        frames.append(body[offset:offset + length])
+        offset += length
+    return frames
+
+@app.route('/recognize_batch', methods=['POST'])
+def recognize_batch():
+    """Recognize several frames in one request; results are returned per frame, in order.
+
+    Queued kiosk uploads may add "captured_at" (see read_capture_times) and
+    a "transforms" JSON list with, per frame, null or the
+    [offset_x, offset_y, scale] of an ROI crop, optionally followed by
+    the kiosk's frame width and height.
+    """
+    try:
+        images_bytes = read_batch_frames()
+        captured_at = read_capture_times(len(images_bytes))
+        transforms = json.loads(request.form['transforms']) if 'transforms' in request.form else None
+        if transforms is not None:
+            if not isinstance(transforms, list) or len(transforms) != len(images_bytes):
+                raise ValueError("transforms needs one entry per frame")
+            transforms = [parse_transform(t) for t in transforms]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not images_bytes:
+        return jsonify({'error': 'No frames uploaded'}), 400
+    request_start = time.perf_counter()
+    try:
+        (frames, worker_stats), queue_stats = get_pool().run(process_images, images_bytes, transforms)
+    except PoolFullError as e:
+        return busy_response(e)
+    record_stats(worker_stats)
+    STAGE_SECONDS.observe("queue_wait", queue_stats["wait_ms"] / 1000.0)
+    results = []
+    for faces, when in zip(frames, captured_at):
+        if faces is None:
+            results.append({"error": "Could not decode image", "recognized": []})
+        else:
+            for face in faces:
+                face["captured_at"] = when
+            results.append({"recognized": mark_recognized(faces)})
+    STAGE_SECONDS.observe("request_total", time.perf_counter() - request_start)
+    return jsonify({
+        "frames": results,
+        "queue": queue_stats,
+        "embedding_cache": worker_stats["embedding_cache"]
+    })
+
+@app.route('/recognize_crops', methods=['POST'])
+def recognize_face_crops():
+    """Recognize face crops from a kiosk that runs its own detector, and mark attendance.
+
+    Crops are uploaded like /recognize_batch frames. An optional "boxes"
+    form field holds a JSON list of their full-frame [x1, y1, x2, y2] boxes,
+    which are echoed back in the results. When frame_width and frame_height
+    fields give the size of the kiosk's frames, crops whose box lies
+    outside the ROI scaled to that size are dropped; kiosks without them
+    apply the ROI themselves. With boxes, a client_id form field (or
+    X-Client-Id header) enables face tracking as on /recognize. Queued uploads may add
+    "captured_at" (see read_capture_times).
+    """
+    client_id = request.form.get('client_id') or request.headers.get('X-Client-Id')
+    try:
+        crops_bytes = read_batch_frames()
+        boxes = read_crop_boxes(len(crops_bytes))
+        frame_size = read_frame_size()
+        captured_at = read_capture_times(len(crops_bytes))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not crops_bytes:
+        return jsonify({'error': 'No crops uploaded'}), 400
+    # The ROI can only be tested when the boxes' frame size is known
+    roi = roi_for_frame(frame_size) if frame_size is not None else None
+    kept = [i for i in range(len(crops_bytes)) if boxes is None or boxes[i] is None
+            or is_inside_polygon(boxes[i][0], boxes[i][1], roi)]
+    if len(kept) < len(crops_bytes):
+        print(f"[DEBUG] Skipping {len(crops_bytes) - len(kept)} crop(s) outside ROI")
+        FACES_REJECTED.inc(len(crops_bytes) - len(kept), "roi")
+    kept_crops = [crops_bytes[i] for i in kept]
+    kept_boxes = [boxes[i] for i in kept] if boxes is not None else None
+    tracking_stats = None
+    request_start = time.perf_counter()
+    try:
+        if client_id and kept_boxes is not None and None not in kept_boxes:
+            faces, queue_stats, worker_stats, tracking_stats = recognize_crops_tracked(kept_crops, kept_boxes, client_id)
+        else:
+            (faces, worker_stats), queue_stats = get_pool().run(recognize_crop_images, kept_crops, kept_boxes)
+            record_stats(worker_stats)
+    except PoolFullError as e:
+        return busy_response(e)
+    STAGE_SECONDS.observe("queue_wait", queue_stats["wait_ms"] / 1000.0)
+    for face in faces:
+        face["captured_at"] = captured_at[kept[face["index"]]]
+    recognized = mark_recognized(faces)
+    STAGE_SECONDS.observe("request_total", time.perf_counter() - request_start)
+    response = {"recognized": recognized, "queue": queue_stats}
+    if "embedding_cache" in worker_stats:
+        response["embedding_cache"] = worker_stats["embedding_cache"]
+    if tracking_stats is not None:
+        response["tracking"] = tracking_stats
+    return jsonify(response)
+
+@app.route('/enroll', methods=['POST'])
+def enroll():
+    """Add a face crop ("file") for "name" to the live gallery and known_faces.
+
+    Costs one embedding; pass replace=1 to drop the person's existing
+    images in the same update. Other inference workers reload the
+    gallery on their next request.
+    """
+    name = request.form.get('name', '')
+    if not ENROLL_NAME.fullmatch(name):
+        return jsonify({'error': 'name must be letters, digits or underscores'}), 400
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file uploaded'}), 400
+    replace = request.form.get('replace', '0').lower() in ('1', 'true', 'yes')
+    try:
+        # One enrollment at a time, so workers never write the gallery concurrently
+        with enroll_lock:
+            (result, worker_stats), _ = get_pool().run(enroll_face, name, request.files['file'].read(), replace)
+    except PoolFullError as e:
+        return busy_response(e)
+    record_stats(worker_stats)
+    if result is None:
+        return jsonify({'error': 'Could not decode image'}), 400
+    print(f"[INFO] Enrolled {name} as {result['identity']}")
+    return jsonify(result), 201
+
+@app.route('/enroll/<name>', methods=['DELETE'])
+def unenroll(name):
+    """Remove a person from the live gallery and known_faces"""
+    if not ENROLL_NAME.fullmatch(name):
+        return jsonify({'error': 'Invalid name'}), 400
+    try:
+        with enroll_lock:
+            (result, worker_stats), _ = get_pool().run(unenroll_face, name)
+    except PoolFullError as e:
+        return busy_response(e)
+    record_stats(worker_stats)
+    if result["removed"] == 0:
+        return jsonify({'error': f'{name} is not enrolled'}), 404
+    print(f"[INFO] Removed {result['removed']} image(s) of {name}")
+    return jsonify(result)
+
+@app.route('/detect', methods=['POST'])
+def detect():
+    """Face boxes and detector confidences only: no embedding, no attendance.
+
+    Pass max_side (pixels) to run the detector on a downscaled frame; boxes
+    are always returned in the uploaded frame's coordinates.
+    """
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file uploaded'}), 400
+    max_side = request.args.get('max_side', type=int)
+    try:
+        (faces, worker_stats), queue_stats = get_pool().run(detect_image, request.files['file'].read(), max_side)
+    except PoolFullError as e:
+        return busy_response(e)
+    record_stats(worker_stats)
+    if faces is None:
+        return jsonify({'error': 'Could not decode image'}), 400
+    return jsonify({"faces": faces, "queue": queue_stats})
+
+@app.route('/metrics')
+def get_metrics():
+    """Per-stage latency histograms and gate counters in Prometheus text format"""
+    return Response(render_all(ALL_METRICS), mimetype='text/plain; version=0.0.4')
+
+def compressible_response(body, mimetype, headers):
+    """Build a response, gzipping the body when the client accepts it"""
+    headers = dict(headers)
+    headers['Vary'] = 'Accept-Encoding'
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        body = gzip.compress(body)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(body, mimetype=mimetype, headers=headers)
 
 @app.route('/attendance')
 def get_attendance():
-    # Adjust the path if attendance.csv is elsewhere
-    return send_file('attendance.csv', as_attachment=True)
+    """Incremental attendance sync.
+
+    Query parameters: since (cursor from a previous response), from / to
+    (YYYY-MM-DD, inclusive), name, and format=json|csv. Only rows appended
+    after `since` that match the filters are returned, with next_cursor
+    to pass on the following call. Cursors are "<epoch>-<row>"; one from a
+    recreated ledger gets all rows back with reset=true. The ETag covers
+    the ledger state and filters, not the cursor, so a client that is up
+    to date gets a 304 on its very next call.
+    """
+    epoch, _, position = request.args.get('since', '0').rpartition('-')
+    try:
+        since = int(position)
+    except ValueError:
+        return jsonify({'error': 'since must be a cursor from a previous response'}), 400
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    name = request.args.get('name')
+    output_format = request.args.get('format', 'json')
+    attendance_ledger = get_ledger()
+    version = f"{attendance_ledger.epoch}|{len(attendance_ledger)}|{date_from}|{date_to}|{name}|{output_format}"
+    etag = '"' + hashlib.sha1(version.encode()).hexdigest() + '"'
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers={'ETag': etag})
+    rows, total, reset = attendance_ledger.query(since, date_from, date_to, name, epoch or None)
+    next_cursor = f"{attendance_ledger.epoch}-{total}"
+    headers = {'ETag': etag, 'X-Next-Cursor': next_cursor}
+    if output_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+        return compressible_response(buffer.getvalue().encode(), 'text/csv', headers)
+    body = json.dumps({
+        "columns": COLUMNS,
+        "rows": rows,
+        "next_cursor": next_cursor,
+        "reset": reset
+    }).encode()
+    return compressible_response(body, 'application/json', headers)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000) 
\ No newline at end of file
+    get_pool()
+    app.run(host='0.0.0.0', port=5000, threaded=True) 
\ No newline at end of file
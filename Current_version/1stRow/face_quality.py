@@ -0,0 +1,57 @@
+import cv2
+import numpy as np
+
+QUALITY_SIZE = 64
+COMPONENTS = ("sharpness", "brightness", "contrast", "pose", "size")
+
+def score_faces(crops, min_face_size=50, size=QUALITY_SIZE, sharpness_norm=100.0):
+    """Quality of a batch of BGR face crops in one float32 pass.
+
+    Every crop is reduced to a size x size grayscale thumbnail, so scores do
+    not depend on how large the face was in the frame and all crops share
+    one array. Per crop, in 0..1:
+      sharpness  - variance of the 4-neighbour Laplacian / sharpness_norm
+      brightness - 1 - |mean - 128| / 128
+      contrast   - standard deviation / 64
+      pose       - left/right symmetry; turned or half-hidden faces score low
+      size       - shorter side of the original crop / (2 * min_face_size)
+    Sharpness and exposure are hard requirements, so the score is the
+    weakest of sharpness, brightness and contrast, scaled by the mean of
+    pose and size: a black, washed-out, flat or badly blurred crop scores
+    near 0 however large and frontal it is.
+    Returns (scores, components): the score per crop and a dict of the
+    component arrays. Empty crops score 0 throughout.
+    """
+    n = len(crops)
+    thumbs = np.zeros((n, size, size), np.float32)
+    sides = np.zeros(n, np.float32)
+    valid = np.zeros(n, bool)
+    for i, crop in enumerate(crops):
+        if crop is None or crop.size == 0:
+            continue
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+        thumbs[i] = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA)
+        sides[i] = min(crop.shape[:2])
+        valid[i] = True
+
+    laplacian = (thumbs[:, :-2, 1:-1] + thumbs[:, 2:, 1:-1] + thumbs[:, 1:-1, :-2] + thumbs[:, 1:-1, 2:]
+                 - 4 * thumbs[:, 1:-1, 1:-1])
+    mean = thumbs.mean(axis=(1, 2))
+    asymmetry = np.abs(thumbs - thumbs[:, :, ::-1]).mean(axis=(1, 2))
+    components = {
+        "sharpness": np.minimum(laplacian.var(axis=(1, 2)) / sharpness_norm, 1.0),
+        "brightness": 1.0 - np.abs(mean - 128.0) / 128.0,
+        "contrast": np.minimum(thumbs.std(axis=(1, 2)) / 64.0, 1.0),
+        "pose": np.clip(1.0 - asymmetry / 64.0, 0.0, 1.0),
+        "size": np.minimum(sides / (2.0 * min_face_size), 1.0),
+    }
+    for name in COMPONENTS:
+        components[name] = np.where(valid, components[name], 0.0).astype(np.float32)
+    required = np.minimum(np.minimum(components["sharpness"], components["brightness"]), components["contrast"])
+    scores = (required * (components["pose"] + components["size"]) / 2.0).astype(np.float32)
+    return scores, components
+
+def weakest_component(components, i):
+    """(name, value) of the lowest-scoring component of crop i"""
+    name = min(COMPONENTS, key=lambda c: components[c][i])
+    return name, float(components[name][i])
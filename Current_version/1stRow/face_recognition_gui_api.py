@@ -5,23 +5,35 @@ A cross-platform GUI for the face recognition attendance system using a cloud AP
 """
 
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext, filedialog
+from tkinter import ttk, messagebox, filedialog
 import threading
-import time
-import requests
 import cv2
 import os
-import pandas as pd
+import socket
 from datetime import datetime
 from PIL import Image, ImageTk
+from attendance_sync import AttendanceSync
+from attendance_viewer import AttendanceViewer
+from client_transport import LiveUploader, RecognitionClient, RoiCropper, load_roi_points
+from motion_gate import MotionGate
+from offline_queue import OfflineQueue, OfflineUploader
+from video_panel import VideoPanel, draw_boxes
+from rate_controller import RateController
+from camera_source import LatestFrameCapture
 
 # Add these at the top of the file (after imports)
-CLOUD_USER = "ubuntu"  # Cloud server username
-CLOUD_IP = "15.206.60.212"  # Elastic IP
-CLOUD_KNOWN_FACES_PATH = "/home/ubuntu/DeepTrack/Current_version/1stRow/known_faces/"
-
 API_URL = "http://15.206.60.212:5000/recognize"  # Cloud API URL
+ENROLL_URL = "http://15.206.60.212:5000/enroll"  # Adds a face to the live gallery
 ATTENDANCE_URL = "http://15.206.60.212:5000/attendance"  # Cloud attendance CSV endpoint
+CLIENT_ID = socket.gethostname()  # Lets the server track faces across this kiosk's frames
+JPEG_QUALITY = 85  # In-memory JPEG quality for uploads
+DISPLAY_FPS = 20  # Preview render rate, independent of network latency
+MOTION_KEEPALIVE = 30  # Seconds between uploads of an unchanged scene
+TARGET_FACE_PX = 112  # ROI crops are downscaled so faces arrive at about this height
+BATCH_URL = "http://15.206.60.212:5000/recognize_batch"  # Bulk endpoint for queued frames
+OFFLINE_QUEUE_DIR = os.path.expanduser("~/.face_recognition/offline_queue")  # Uploads kept while the API is unreachable
+DETECT_URL = "http://15.206.60.212:5000/detect"  # Detection-only endpoint for capture previews
+PREVIEW_DETECT_MAX_SIDE = 640  # Server downscales preview frames to this size before YOLO
 
 class ToolTip:
     def __init__(self, widget, text):
@@ -77,6 +89,15 @@ class FaceRecognitionGUI:
         self.pause_timer = None
         self.last_recognized_faces = []  # Store last recognized faces for display
         self.last_detection_boxes = []   # Store last detected boxes for display
+        self.client = RecognitionClient(jpeg_quality=JPEG_QUALITY)
+        self.attendance_sync = AttendanceSync(ATTENDANCE_URL, "attendance_downloaded.csv", session=self.client.session)
+        self.motion_gate = MotionGate(keepalive_seconds=MOTION_KEEPALIVE)
+        self.rate = RateController()
+        self.cropper = RoiCropper(*load_roi_points(), target_face_px=TARGET_FACE_PX)
+        self.uploader = OfflineUploader(OfflineQueue(OFFLINE_QUEUE_DIR), self.client.session, {"frame": BATCH_URL})
+        self.uploader.start()
+        self.live = LiveUploader(self.client, self.rate, self.motion_gate, self.cropper, self.uploader,
+                                 API_URL, CLIENT_ID, timeout=10)
         self.create_widgets()
         self.update_status()
 
@@ -172,9 +193,13 @@ class FaceRecognitionGUI:
         card.columnconfigure(0, weight=1)
         self.progress = ttk.Progressbar(card, mode='indeterminate', length=220)
         self.progress.grid(row=5, column=0, sticky="ew", pady=(12, 0))
-        # Video frame panel
-        self.frame_panel = tk.Label(main_frame, bg="#222", width=480, height=320)
-        self.frame_panel.pack(pady=10)
+        # Video frame panel (recreated by toggle_dark_mode, so stop the old one's timer)
+        if getattr(self, "video", None) is not None:
+            self.video.stop()
+        self.video = VideoPanel(main_frame, 480, 320, fps=DISPLAY_FPS, overlay=self.draw_results, bg="#222")
+        self.video.pack(pady=10)
+        self.video.start()
+        self.frame_panel = self.video.label
         self.result_label = tk.Label(main_frame, text="Recognition results will appear here.", font=("Arial", 12), bg="#f4f7fa", fg="#333")
         self.result_label.pack(pady=5)
         # Status bar at the bottom
@@ -183,7 +208,7 @@ class FaceRecognitionGUI:
         self.status_label = ttk.Label(status_bar, text="Ready to start face recognition", style='Status.TLabel', anchor="w")
         self.status_label.pack(fill=tk.X, padx=10, pady=4)
         # Start camera and detection loop (but NOT recognition) automatically
-        self.cap = cv2.VideoCapture(0)
+        self.cap = LatestFrameCapture(0)
         self.stop_event.clear()
         self.recognition_thread = threading.Thread(target=self.recognition_loop, daemon=True)
         self.recognition_thread.start()
@@ -200,7 +225,10 @@ class FaceRecognitionGUI:
         self.start_btn.configure(text="Stop Recognition", style='Stop.TButton')
         self.progress.start()
         self.stop_event.clear()
-        self.cap = cv2.VideoCapture(0)
+        if self.cap:
+            # Only one reader thread may hold the camera
+            self.cap.release()
+        self.cap = LatestFrameCapture(0)
         self.recognition_thread = threading.Thread(target=self.recognition_loop, daemon=True)
         self.recognition_thread.start()
 
@@ -215,41 +243,20 @@ class FaceRecognitionGUI:
         self.update_status_text("Face recognition stopped")
 
     def recognition_loop(self):
-        while not self.stop_event.is_set():
-            ret, frame = self.cap.read() if self.cap else (False, None)
-            if not ret or frame is None:
-                self.update_status_text("Failed to capture frame from camera.")
+        cap, frame_id = self.cap, 0
+        while not self.stop_event.is_set() and cap is self.cap:
+            frame, captured_at, frame_id = cap.latest(frame_id) if cap else (None, 0.0, 0)
+            if frame is None:
+                self.root.after(0, self.update_status_text, "Failed to capture frame from camera.")
                 break
-            display_frame = frame.copy()
-            # Always run detection for bounding boxes and names
-            temp_path = "temp_frame.jpg"
-            cv2.imwrite(temp_path, frame)
-            detected_faces = []
+            self.video.publish(frame)
+            # Upload at the adaptive rate, skipping unchanged scenes, unless a recognition was requested
             try:
-                with open(temp_path, "rb") as img_file:
-                    files = {"file": img_file}
-                    response = requests.post(API_URL, files=files, timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-                    detected_faces = data.get("recognized", [])
+                detected_faces = self.live.upload(frame, captured_at, force=self.is_recognition_running)
+                if detected_faces is not None:
                     self.last_detection_boxes = detected_faces
             except Exception as e:
                 print(f"[DEBUG] Exception in detection: {e}")
-            # Draw bounding boxes and names for detection
-            for person in self.last_detection_boxes:
-                box = person.get("box", None)
-                name = person.get("name", "Unknown")
-                if box and len(box) == 4:
-                    x1, y1, x2, y2 = box
-                    cv2.rectangle(display_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    cv2.putText(display_frame, name, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-            # Show annotated frame in GUI
-            rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(rgb)
-            imgtk = ImageTk.PhotoImage(image=img.resize((480, 320)))
-            if self.frame_panel is not None:
-                self._imgtk = imgtk  # Store reference to avoid garbage collection
-                self.frame_panel.config(image=imgtk)
             # Only do recognition/attendance marking if triggered
             if self.is_recognition_running and not self.is_paused:
                 self.is_recognition_running = False  # Only run once per button press
@@ -259,12 +266,20 @@ class FaceRecognitionGUI:
                     attendance = person.get("attendance", "")
                     if attendance in ["in", "out", "already_marked"]:
                         self.is_paused = True
-                        self.show_attendance_popup(frame, name, attendance)
+                        # Tk calls must run on the main loop, not this thread
+                        self.root.after(0, self.show_attendance_popup, frame, name, attendance)
                         marked = True
                         break
-                if not marked and self.result_label is not None:
-                    self.result_label.config(text="No attendance marked.", fg="#b71c1c")
-            time.sleep(1)  # Adjust interval as needed
+                if not marked:
+                    self.root.after(0, self.show_result_text, "No attendance marked.", "#b71c1c")
+
+    def draw_results(self, canvas, scale_x, scale_y):
+        """VideoPanel overlay: newest recognition boxes on the scaled preview"""
+        draw_boxes(canvas, list(self.last_detection_boxes), scale_x, scale_y, font_scale=0.8)
+
+    def show_result_text(self, text, color):
+        if self.result_label is not None:
+            self.result_label.config(text=text, fg=color)
 
     def trigger_recognition(self):
         # Allow repeated recognition attempts
@@ -369,8 +384,8 @@ class FaceRecognitionGUI:
         capture_window.grab_set()
         
         # Create video display
-        video_label = tk.Label(capture_window, bg="black")
-        video_label.pack(pady=10)
+        preview = VideoPanel(capture_window, 640, 480, bg="black")
+        preview.pack(pady=10)
         
         # Status label
         status_label = tk.Label(capture_window, text="Position your face in the frame", 
@@ -387,7 +402,7 @@ class FaceRecognitionGUI:
         captured_face = None
         face_detected = False
         detected_boxes = []
-        cap = cv2.VideoCapture(0)
+        cap = LatestFrameCapture(0)
         
         def update_frame():
             nonlocal captured_face, face_detected, detected_boxes
@@ -400,21 +415,17 @@ class FaceRecognitionGUI:
             # Resize frame for display
             display_frame = cv2.resize(frame, (640, 480))
             
-            # Send frame to cloud API for face detection
-            temp_path = "temp_capture_frame.jpg"
-            cv2.imwrite(temp_path, frame)
-            
             face_detected = False
             detected_boxes.clear()
             
+            # Send frame to cloud API for face detection only (no recognition/attendance)
             try:
-                with open(temp_path, "rb") as img_file:
-                    files = {"file": img_file}
-                    response = requests.post(API_URL, files=files, timeout=10)
+                response = self.client.post_frame(DETECT_URL, frame, timeout=10,
+                                                   params={"max_side": PREVIEW_DETECT_MAX_SIDE})
                 
                 if response.status_code == 200:
                     data = response.json()
-                    detected_boxes = data.get("recognized", [])
+                    detected_boxes = data.get("faces", [])
                     
                     # Draw detection boxes
                     for person in detected_boxes:
@@ -445,12 +456,7 @@ class FaceRecognitionGUI:
                 status_label.config(text="No face detected - Position your face clearly", fg="#f44336")
             
             # Display frame
-            rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(rgb)
-            imgtk = ImageTk.PhotoImage(image=img)
-            video_label.config(image=imgtk)
-            # Store reference to prevent garbage collection
-            setattr(video_label, 'imgtk', imgtk)
+            preview.show(display_frame)
             
             # Schedule next update
             capture_window.after(100, update_frame)
@@ -514,11 +520,13 @@ class FaceRecognitionGUI:
             filepath = os.path.join(known_faces_dir, filename)
             
             # Check if file already exists
+            replace = False
             if os.path.exists(filepath):
                 response = messagebox.askyesno("File Exists", 
                                             f"{filename} already exists. Do you want to overwrite it?")
                 if not response:
                     return
+                replace = True
             
             # Save the face image
             cv2.imwrite(filepath, face_image)
@@ -527,53 +535,47 @@ class FaceRecognitionGUI:
             messagebox.showinfo("Success", 
                               f"Face saved as: {filename}\nLocation: {os.path.abspath(filepath)}")
             
-            # Upload to cloud server if needed
-            self.upload_face_to_cloud(filepath, filename)
+            # Enroll on the cloud server
+            self.upload_face_to_cloud(face_image, clean_name, replace)
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save face: {e}")
 
-    def upload_face_to_cloud(self, filepath, filename):
-        """Upload the captured face to the cloud server automatically using scp"""
-        import subprocess
+    def upload_face_to_cloud(self, face_image, name, replace=False):
+        """Enroll the captured face on the cloud server: one embedding, no gallery rebuild"""
         try:
-            remote_path = f"{CLOUD_USER}@{CLOUD_IP}:{CLOUD_KNOWN_FACES_PATH}{filename}"
-            result = subprocess.run([
-                "scp", filepath, remote_path
-            ], capture_output=True, text=True)
-            if result.returncode == 0:
-                messagebox.showinfo("Upload Success", f"Face uploaded to cloud server at:\n{remote_path}")
+            response = self.client.post_jpeg(ENROLL_URL, self.client.encode(face_image), timeout=30,
+                                             data={"name": name, "replace": int(replace)}, filename=f"{name}.jpg")
+            if response.status_code == 201:
+                result = response.json()
+                messagebox.showinfo("Upload Success",
+                                    f"{name} enrolled on the cloud server\n"
+                                    f"Gallery now has {result['gallery_size']} face(s)")
             else:
-                messagebox.showerror("Upload Failed", f"Failed to upload face to cloud.\n\nError: {result.stderr}")
+                messagebox.showerror("Upload Failed",
+                                     f"Failed to enroll face on cloud.\n\nError: {response.json().get('error', response.status_code)}")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to upload face: {e}")
 
     def view_attendance(self):
-        # Download attendance CSV from server (if available)
+        # Sync attendance from server, fetching only rows added since the last view
         try:
-            response = requests.get(ATTENDANCE_URL, timeout=10)
-            if response.status_code == 200:
-                with open("attendance_downloaded.csv", "wb") as f:
-                    f.write(response.content)
-                df = pd.read_csv("attendance_downloaded.csv")
-                self.show_attendance_window(df)
-            else:
-                messagebox.showerror("Error", f"Failed to fetch attendance: {response.status_code}")
+            df = self.attendance_sync.refresh()
+            self.show_attendance_window(df)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to fetch attendance: {e}")
 
     def show_attendance_window(self, df):
-        top = tk.Toplevel(self.root)
-        top.title("Attendance Records")
-        text = scrolledtext.ScrolledText(top, width=80, height=25)
-        text.pack(padx=10, pady=10)
-        text.insert(tk.END, df.to_string(index=False))
-        text.config(state=tk.DISABLED)
+        """Show attendance records in a paged, filterable table"""
+        AttendanceViewer(self.root, df)
 
     def show_settings(self):
         top = tk.Toplevel(self.root)
         top.title("Settings & Info")
-        info = f"API URL: {API_URL}\nAttendance URL: {ATTENDANCE_URL}\nCamera: 0 (default)\n"
+        info = (f"API URL: {API_URL}\nAttendance URL: {ATTENDANCE_URL}\nCamera: 0 (default)\n"
+                f"JPEG quality: {JPEG_QUALITY}\n{self.client.timings_text()}\n{self.motion_gate.stats_text()}\n"
+                f"{self.rate.status_text()}\n"
+                f"Upload queue: {self.uploader.status_text()}\n")
         tk.Label(top, text=info, font=("Arial", 12)).pack(padx=10, pady=10)
 
     def update_status_text(self, text):
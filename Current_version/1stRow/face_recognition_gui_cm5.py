@@ -5,23 +5,39 @@ Optimized version of the original GUI for CM5's enhanced capabilities
 """
 
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext, filedialog
+from tkinter import ttk, messagebox, filedialog
 import threading
 import time
-import requests
 import cv2
 import os
-import pandas as pd
+import socket
 from datetime import datetime
 from PIL import Image, ImageTk
+from attendance_sync import AttendanceSync
+from attendance_viewer import AttendanceViewer
+from client_transport import LiveUploader, RecognitionClient, RoiCropper, load_roi_points
+from motion_gate import MotionGate
+from offline_queue import OfflineQueue, OfflineUploader
+from video_panel import VideoPanel, draw_boxes
+from rate_controller import RateController
+from camera_source import LatestFrameCapture, open_camera
 
 # At the top of the file (after imports)
-CLOUD_USER = "ubuntu"  # Cloud server username
-CLOUD_IP = "15.206.60.212"  # Elastic IP
-CLOUD_KNOWN_FACES_PATH = "/home/ubuntu/DeepTrack/Current_version/1stRow/known_faces/"
-
 API_URL = "http://15.206.60.212:5000/recognize"  # Cloud API URL
+ENROLL_URL = "http://15.206.60.212:5000/enroll"  # Adds a face to the live gallery
 ATTENDANCE_URL = "http://15.206.60.212:5000/attendance"  # Cloud attendance CSV endpoint
+CLIENT_ID = socket.gethostname()  # Lets the server track faces across this kiosk's frames
+JPEG_QUALITY = 85  # In-memory JPEG quality for uploads
+MAX_IN_FLIGHT = 2  # Recognition requests allowed in flight at once
+DISPLAY_FPS = 20  # Preview render rate, independent of network latency
+DETECT_URL = "http://15.206.60.212:5000/detect"  # Detection-only endpoint for capture previews
+PREVIEW_DETECT_MAX_SIDE = 640  # Server downscales preview frames to this size before YOLO
+MOTION_KEEPALIVE = 30  # Seconds between uploads of an unchanged scene
+TARGET_FACE_PX = 112  # ROI crops are downscaled so faces arrive at about this height
+LOCAL_DETECTION = True  # Detect faces on the CM5 and upload only the crops
+CROPS_URL = "http://15.206.60.212:5000/recognize_crops"  # Crop-level recognition endpoint
+BATCH_URL = "http://15.206.60.212:5000/recognize_batch"  # Bulk endpoint for queued full frames
+OFFLINE_QUEUE_DIR = os.path.expanduser("~/.face_recognition/offline_queue")  # Uploads kept while the API is unreachable
 
 class ToolTip:
     def __init__(self, widget, text):
@@ -71,6 +87,26 @@ class CM5FaceRecognitionGUI:
         self.pause_timer = None
         self.last_recognized_faces = []
         self.last_detection_boxes = []
+        # Pipeline state: newest recognition result (the camera keeps the newest frame)
+        self.frame_lock = threading.Lock()
+        self.result_seq = 0
+        self.handled_result_seq = 0
+        self.dispatched_frame_id = 0  # Newest camera frame any upload thread has taken
+        self.rate = RateController()
+        self.pipeline_threads = []
+        self.completed_uploads = 0
+        self.stats_since = time.time()
+        self.client = RecognitionClient(jpeg_quality=JPEG_QUALITY)
+        self.attendance_sync = AttendanceSync(ATTENDANCE_URL, "/tmp/attendance_downloaded.csv", session=self.client.session)
+        self.motion_gate = MotionGate(keepalive_seconds=MOTION_KEEPALIVE)
+        self.cropper = RoiCropper(*load_roi_points(), target_face_px=TARGET_FACE_PX)
+        self.local_detector = None
+        self.detector_loading = False
+        self.uploader = OfflineUploader(OfflineQueue(OFFLINE_QUEUE_DIR), self.client.session,
+                                        {"crop": CROPS_URL, "frame": BATCH_URL})
+        self.uploader.start()
+        self.live = LiveUploader(self.client, self.rate, self.motion_gate, self.cropper, self.uploader,
+                                 API_URL, CLIENT_ID, crops_url=CROPS_URL)
         
         self.create_widgets()
         self.update_status()
@@ -155,8 +191,10 @@ class CM5FaceRecognitionGUI:
         self.progress.grid(row=5, column=0, sticky="ew", pady=(12, 0))
         
         # Video frame panel (larger for CM5)
-        self.frame_panel = tk.Label(main_frame, bg="#222", width=640, height=480)
-        self.frame_panel.pack(pady=10)
+        self.video = VideoPanel(main_frame, 640, 480, fps=DISPLAY_FPS, overlay=self.draw_results, bg="#222")
+        self.video.pack(pady=10)
+        self.video.start()
+        self.frame_panel = self.video.label
         
         self.result_label = tk.Label(main_frame, text="Recognition results will appear here.", 
                                    font=("Arial", 12), bg="#f4f7fa", fg="#333")
@@ -180,24 +218,22 @@ class CM5FaceRecognitionGUI:
         self.progress.start()
         self.stop_event.clear()
         
-        # Try different camera indices for CM5
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
-            for i in range(4):
-                self.cap = cv2.VideoCapture(i)
-                if self.cap.isOpened():
-                    break
-        
-        if not self.cap.isOpened():
+        # Try different camera indices for CM5, at a higher resolution; every frame goes to the preview
+        self.cap = open_camera(width=1280, height=720, on_frame=self.video.publish)
+        if self.cap is None:
             messagebox.showerror("Error", "No camera found")
             return
-            
-        # Set higher resolution for CM5
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        
-        self.recognition_thread = threading.Thread(target=self.recognition_loop, daemon=True)
-        self.recognition_thread.start()
+        if LOCAL_DETECTION and self.local_detector is None and not self.detector_loading:
+            # Loading the model takes seconds; full frames are uploaded until it is ready
+            self.detector_loading = True
+            threading.Thread(target=self.load_local_detector, daemon=True).start()
+        
+        self.dispatched_frame_id = 0
+        self.pipeline_threads = [threading.Thread(target=self.upload_loop, daemon=True) for _ in range(MAX_IN_FLIGHT)]
+        for thread in self.pipeline_threads:
+            thread.start()
+        self.recognition_thread = self.pipeline_threads[0]
+        self.root.after(0, self.poll_results)
 
     def stop_face_recognition(self):
         """Stop recognition"""
@@ -210,69 +246,107 @@ class CM5FaceRecognitionGUI:
             self.cap = None
         self.update_status_text("Face recognition stopped")
 
-    def recognition_loop(self):
-        """Main recognition loop optimized for CM5"""
-        while not self.stop_event.is_set():
-            ret, frame = self.cap.read() if self.cap else (False, None)
-            if not ret or frame is None:
-                self.update_status_text("Failed to capture frame from camera.")
+    def upload_loop(self):
+        """Upload the newest frame at the adaptive rate.
+
+        MAX_IN_FLIGHT of these threads run at once, which bounds the open
+        requests; the dispatched frame id is shared so no two of them send
+        the same frame.
+        """
+        while self.rate.acquire(self.stop_event):
+            cap = self.cap
+            if cap is None:
                 break
-                
-            display_frame = frame.copy()
-            
-            # Save frame for API call
-            temp_path = "/tmp/temp_frame.jpg"
-            cv2.imwrite(temp_path, frame)
-            
-            detected_faces = []
+            frame = self.take_next_frame(cap)
+            if frame is None:
+                if not cap.isOpened():
+                    self.root.after(0, self.update_status_text, "Failed to capture frame from camera.")
+                    break
+                continue
+            frame, captured_at = frame
             try:
-                with open(temp_path, "rb") as img_file:
-                    files = {"file": img_file}
-                    response = requests.post(API_URL, files=files, timeout=15)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    detected_faces = data.get("recognized", [])
-                    self.last_detection_boxes = detected_faces
-                    
+                # Skip frames of an unchanged scene unless a recognition was requested
+                recognized = self.live.upload(frame, captured_at, force=self.is_recognition_running,
+                                              rate_acquired=True, detector=self.local_detector)
+                if recognized is not None:
+                    with self.frame_lock:
+                        self.last_detection_boxes = recognized
+                        self.last_frame = frame
+                        self.result_seq += 1
+                        self.completed_uploads += 1
             except Exception as e:
                 print(f"[DEBUG] Exception in detection: {e}")
-                
-            # Draw bounding boxes and names
-            for person in self.last_detection_boxes:
-                box = person.get("box", None)
+
+    def take_next_frame(self, cap):
+        """(frame, captured_at) of a frame no other upload thread has taken, or None"""
+        while not self.stop_event.is_set():
+            with self.frame_lock:
+                newer_than = self.dispatched_frame_id
+            frame, captured_at, frame_id = cap.latest(newer_than, timeout=1.0)
+            if frame is None:
+                return None
+            with self.frame_lock:
+                if frame_id > self.dispatched_frame_id:
+                    self.dispatched_frame_id = frame_id
+                    return frame, captured_at
+        return None
+
+    def load_local_detector(self):
+        """Load the on-device detector for LOCAL_DETECTION mode (runs on a background thread).
+
+        Until it is set, and if it fails to load, uploads fall back to
+        server-side detection.
+        """
+        try:
+            from local_detector import LocalFaceDetector
+            self.local_detector = LocalFaceDetector()
+            print("[DEBUG] Local detector ready, uploading face crops")
+        except Exception as e:
+            print(f"[DEBUG] Local detector unavailable, uploading full frames: {e}")
+        finally:
+            self.detector_loading = False
+
+    def draw_results(self, canvas, scale_x, scale_y):
+        """VideoPanel overlay: newest recognition boxes on the scaled preview"""
+        with self.frame_lock:
+            boxes = list(self.last_detection_boxes)
+        draw_boxes(canvas, boxes, scale_x, scale_y, font_scale=0.8)
+
+    def poll_results(self):
+        """Act on new recognition results and refresh the rate display (Tk thread)"""
+        if self.stop_event.is_set():
+            return
+        with self.frame_lock:
+            boxes = list(self.last_detection_boxes)
+            result_frame = self.last_frame
+            new_result = self.result_seq != self.handled_result_seq
+            self.handled_result_seq = self.result_seq
+        
+        # Handle recognition trigger once a fresh result has arrived
+        if new_result and self.is_recognition_running and not self.is_paused:
+            self.is_recognition_running = False
+            marked = False
+            for person in boxes:
                 name = person.get("name", "Unknown")
-                if box and len(box) == 4:
-                    x1, y1, x2, y2 = box
-                    cv2.rectangle(display_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    cv2.putText(display_frame, name, (x1, y1 - 10), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-            
-            # Display frame
-            rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(rgb)
-            imgtk = ImageTk.PhotoImage(image=img.resize((640, 480)))
-            if self.frame_panel is not None:
-                self._imgtk = imgtk
-                self.frame_panel.config(image=imgtk)
-            
-            # Handle recognition trigger
-            if self.is_recognition_running and not self.is_paused:
-                self.is_recognition_running = False
-                marked = False
-                for person in self.last_detection_boxes:
-                    name = person.get("name", "Unknown")
-                    attendance = person.get("attendance", "")
-                    if attendance in ["in", "out", "already_marked"]:
-                        self.is_paused = True
-                        self.show_attendance_popup(frame, name, attendance)
-                        marked = True
-                        break
-                        
-                if not marked and self.result_label is not None:
-                    self.result_label.config(text="No attendance marked.", fg="#b71c1c")
+                attendance = person.get("attendance", "")
+                if attendance in ["in", "out", "already_marked"]:
+                    self.is_paused = True
+                    self.show_attendance_popup(result_frame, name, attendance)
+                    marked = True
+                    break
                     
-            time.sleep(0.3)  # Faster loop for CM5
+            if not marked and self.result_label is not None:
+                self.result_label.config(text="No attendance marked.", fg="#b71c1c")
+        
+        elapsed = time.time() - self.stats_since
+        if elapsed >= 2.0:
+            self.update_status_text(f"Preview: {self.video.rendered / elapsed:.1f} FPS, "
+                                    f"Recognition: {self.completed_uploads / elapsed:.1f} results/s, "
+                                    f"{self.rate.status_text()}")
+            self.video.rendered = 0
+            self.completed_uploads = 0
+            self.stats_since = time.time()
+        self.root.after(int(1000 / DISPLAY_FPS), self.poll_results)
 
     def trigger_recognition(self):
         """Trigger recognition"""
@@ -379,8 +453,8 @@ class CM5FaceRecognitionGUI:
         capture_window.grab_set()
         
         # Create video display
-        video_label = tk.Label(capture_window, bg="black")
-        video_label.pack(pady=10)
+        preview = VideoPanel(capture_window, 640, 480, bg="black")
+        preview.pack(pady=10)
         
         # Status label
         status_label = tk.Label(capture_window, text="Position your face in the frame", 
@@ -397,7 +471,7 @@ class CM5FaceRecognitionGUI:
         captured_face = None
         face_detected = False
         detected_boxes = []
-        cap = cv2.VideoCapture(0)
+        cap = LatestFrameCapture(0)
         
         def update_frame():
             nonlocal captured_face, face_detected, detected_boxes
@@ -410,21 +484,17 @@ class CM5FaceRecognitionGUI:
             # Resize frame for display
             display_frame = cv2.resize(frame, (640, 480))
             
-            # Send frame to cloud API for face detection
-            temp_path = "/tmp/capture_frame.jpg"
-            cv2.imwrite(temp_path, frame)
-            
             face_detected = False
             detected_boxes.clear()
             
+            # Send frame to cloud API for face detection only (no recognition/attendance)
             try:
-                with open(temp_path, "rb") as img_file:
-                    files = {"file": img_file}
-                    response = requests.post(API_URL, files=files, timeout=10)
+                response = self.client.post_frame(DETECT_URL, frame, timeout=10,
+                                                   params={"max_side": PREVIEW_DETECT_MAX_SIDE})
                 
                 if response.status_code == 200:
                     data = response.json()
-                    detected_boxes = data.get("recognized", [])
+                    detected_boxes = data.get("faces", [])
                     
                     # Draw detection boxes
                     for person in detected_boxes:
@@ -455,12 +525,7 @@ class CM5FaceRecognitionGUI:
                 status_label.config(text="No face detected - Position your face clearly", fg="#f44336")
             
             # Display frame
-            rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(rgb)
-            imgtk = ImageTk.PhotoImage(image=img)
-            video_label.config(image=imgtk)
-            # Store reference to prevent garbage collection
-            setattr(video_label, 'imgtk', imgtk)
+            preview.show(display_frame)
             
             # Schedule next update
             capture_window.after(100, update_frame)
@@ -524,11 +589,13 @@ class CM5FaceRecognitionGUI:
             filepath = os.path.join(known_faces_dir, filename)
             
             # Check if file already exists
+            replace = False
             if os.path.exists(filepath):
                 response = messagebox.askyesno("File Exists", 
                                             f"{filename} already exists. Do you want to overwrite it?")
                 if not response:
                     return
+                replace = True
             
             # Save the face image
             cv2.imwrite(filepath, face_image)
@@ -537,51 +604,50 @@ class CM5FaceRecognitionGUI:
             messagebox.showinfo("Success", 
                               f"Face saved as: {filename}\nLocation: {os.path.abspath(filepath)}")
             
-            # Upload to cloud server if needed
-            self.upload_face_to_cloud(filepath, filename)
+            # Enroll on the cloud server
+            self.upload_face_to_cloud(face_image, clean_name, replace)
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save face: {e}")
 
-    def upload_face_to_cloud(self, filepath, filename):
-        """Upload the captured face to the cloud server"""
+    def upload_face_to_cloud(self, face_image, name, replace=False):
+        """Enroll the captured face on the cloud server: one embedding, no gallery rebuild"""
         try:
-            # For now, just show a message about manual upload
-            messagebox.showinfo("Upload", 
-                              f"Face saved locally as {filename}\n\n"
-                              f"To upload to cloud server, use:\n"
-                              f"scp {filepath} {CLOUD_USER}@{CLOUD_IP}:{CLOUD_KNOWN_FACES_PATH}")
+            response = self.client.post_jpeg(ENROLL_URL, self.client.encode(face_image), timeout=30,
+                                             data={"name": name, "replace": int(replace)}, filename=f"{name}.jpg")
+            if response.status_code == 201:
+                result = response.json()
+                messagebox.showinfo("Upload Success",
+                                    f"{name} enrolled on the cloud server\n"
+                                    f"Gallery now has {result['gallery_size']} face(s)")
+            else:
+                messagebox.showerror("Upload Failed",
+                                     f"Failed to enroll face on cloud.\n\nError: {response.json().get('error', response.status_code)}")
         except Exception as e:
-            print(f"Upload error: {e}")
+            messagebox.showerror("Error", f"Failed to upload face: {e}")
 
     def view_attendance(self):
-        """View attendance records"""
+        """View attendance records (only new rows are downloaded)"""
         try:
-            response = requests.get(ATTENDANCE_URL, timeout=10)
-            if response.status_code == 200:
-                with open("/tmp/attendance_downloaded.csv", "wb") as f:
-                    f.write(response.content)
-                df = pd.read_csv("/tmp/attendance_downloaded.csv")
-                self.show_attendance_window(df)
-            else:
-                messagebox.showerror("Error", f"Failed to fetch attendance: {response.status_code}")
+            df = self.attendance_sync.refresh()
+            self.show_attendance_window(df)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to fetch attendance: {e}")
 
     def show_attendance_window(self, df):
-        """Show attendance window"""
-        top = tk.Toplevel(self.root)
-        top.title("Attendance Records")
-        text = scrolledtext.ScrolledText(top, width=80, height=25)
-        text.pack(padx=10, pady=10)
-        text.insert(tk.END, df.to_string(index=False))
-        text.config(state=tk.DISABLED)
+        """Show attendance records in a paged, filterable table"""
+        AttendanceViewer(self.root, df)
 
     def show_settings(self):
         """Show settings"""
         top = tk.Toplevel(self.root)
         top.title("Settings & Info")
-        info = f"API URL: {API_URL}\nAttendance URL: {ATTENDANCE_URL}\nCamera: 0 (default)\nPlatform: Raspberry Pi CM5"
+        info = (f"API URL: {API_URL}\nAttendance URL: {ATTENDANCE_URL}\nCamera: 0 (default)\nPlatform: Raspberry Pi CM5\n"
+                f"Detection: {'on-device' if self.local_detector is not None else 'server'}\n"
+                f"JPEG quality: {JPEG_QUALITY}\n{self.client.timings_text()}\n{self.motion_gate.stats_text()}\n"
+                f"{self.rate.status_text()}\n"
+                f"{self.cap.stats_text() if self.cap else 'Camera: stopped'}\n"
+                f"Upload queue: {self.uploader.status_text()}")
         tk.Label(top, text=info, font=("Arial", 12)).pack(padx=10, pady=10)
 
     def update_status_text(self, text):
@@ -8,14 +8,29 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import threading
 import time
-import requests
 import cv2
 import os
-from PIL import Image, ImageTk
+import socket
+from attendance_sync import AttendanceSync
+from attendance_viewer import AttendanceViewer
+from client_transport import LiveUploader, RecognitionClient, RoiCropper, load_roi_points
+from motion_gate import MotionGate
+from offline_queue import OfflineQueue, OfflineUploader
+from video_panel import VideoPanel, draw_boxes
+from rate_controller import RateController
+from camera_source import open_camera
 
 # Cloud API URLs
 API_URL = "http://13.201.230.71:5000/recognize"
 ATTENDANCE_URL = "http://13.201.230.71:5000/attendance"
+CLIENT_ID = socket.gethostname()  # Lets the server track faces across this kiosk's frames
+JPEG_QUALITY = 85  # In-memory JPEG quality for uploads
+DISPLAY_FPS = 10  # Preview render rate; kept low to spare the Pi's CPU
+MOTION_KEEPALIVE = 30  # Seconds between uploads of an unchanged scene
+TARGET_FACE_PX = 112  # ROI crops are downscaled so faces arrive at about this height
+BATCH_URL = "http://13.201.230.71:5000/recognize_batch"  # Bulk endpoint for queued frames
+OFFLINE_QUEUE_DIR = os.path.expanduser("~/.face_recognition/offline_queue")  # Uploads kept while the API is unreachable
+STATS_INTERVAL = 10  # Seconds between upload statistics lines in the log
 
 class PiFaceRecognitionGUI:
     def __init__(self):
@@ -31,6 +46,16 @@ class PiFaceRecognitionGUI:
         self.is_recognition_running = False
         self.is_paused = False
         self.last_detection_boxes = []
+        self.last_stats_print = 0.0
+        self.client = RecognitionClient(jpeg_quality=JPEG_QUALITY)
+        self.attendance_sync = AttendanceSync(ATTENDANCE_URL, "/tmp/attendance.csv", session=self.client.session)
+        self.motion_gate = MotionGate(keepalive_seconds=MOTION_KEEPALIVE)
+        self.rate = RateController()
+        self.cropper = RoiCropper(*load_roi_points(), target_face_px=TARGET_FACE_PX)
+        self.uploader = OfflineUploader(OfflineQueue(OFFLINE_QUEUE_DIR), self.client.session, {"frame": BATCH_URL})
+        self.uploader.start()
+        self.live = LiveUploader(self.client, self.rate, self.motion_gate, self.cropper, self.uploader,
+                                 API_URL, CLIENT_ID)
         
         self.create_widgets()
         self.start_camera()
@@ -51,8 +76,10 @@ class PiFaceRecognitionGUI:
         main_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
         
         # Video frame (smaller for Pi)
-        self.frame_panel = tk.Label(main_frame, bg="black", width=640, height=480)
-        self.frame_panel.pack(pady=10)
+        self.video = VideoPanel(main_frame, 640, 480, fps=DISPLAY_FPS, overlay=self.draw_results, bg="black")
+        self.video.pack(pady=10)
+        self.video.start()
+        self.frame_panel = self.video.label
         
         # Control buttons
         button_frame = tk.Frame(main_frame, bg="#f0f0f0")
@@ -88,21 +115,11 @@ class PiFaceRecognitionGUI:
     def start_camera(self):
         """Start camera capture"""
         try:
-            self.cap = cv2.VideoCapture(0)
-            if not self.cap.isOpened():
-                # Try different camera indices for Pi
-                for i in range(4):
-                    self.cap = cv2.VideoCapture(i)
-                    if self.cap.isOpened():
-                        break
-            
-            if not self.cap.isOpened():
+            # Try different camera indices for Pi, at a lower resolution for performance
+            self.cap = open_camera(width=640, height=480)
+            if self.cap is None:
                 messagebox.showerror("Error", "No camera found")
                 return
-                
-            # Set lower resolution for Pi performance
-            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
             
             self.recognition_thread = threading.Thread(target=self.recognition_loop, daemon=True)
             self.recognition_thread.start()
@@ -113,54 +130,28 @@ class PiFaceRecognitionGUI:
 
     def recognition_loop(self):
         """Main recognition loop optimized for Pi"""
+        frame_id = 0
         while not self.stop_event.is_set():
-            ret, frame = self.cap.read() if self.cap else (False, None)
-            if not ret or frame is None:
+            frame, captured_at, frame_id = self.cap.latest(frame_id) if self.cap else (None, 0.0, frame_id)
+            if frame is None:
                 time.sleep(0.1)
                 continue
                 
             # Resize frame for better performance
             frame = cv2.resize(frame, (640, 480))
-            display_frame = frame.copy()
+            self.video.publish(frame)
             
-            # Save frame for API call
-            temp_path = "/tmp/temp_frame.jpg"
-            cv2.imwrite(temp_path, frame)
-            
-            # Call cloud API for detection
-            detected_faces = []
+            # Upload at the adaptive rate, skipping unchanged scenes, unless a recognition was requested
             try:
-                with open(temp_path, "rb") as img_file:
-                    files = {"file": img_file}
-                    response = requests.post(API_URL, files=files, timeout=15)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    detected_faces = data.get("recognized", [])
+                detected_faces = self.live.upload(frame, captured_at, force=self.is_recognition_running)
+                if detected_faces is not None:
                     self.last_detection_boxes = detected_faces
-                    
             except Exception as e:
                 print(f"API Error: {e}")
+            if time.time() - self.last_stats_print >= STATS_INTERVAL:
+                self.last_stats_print = time.time()
+                print(f"[DEBUG] {self.live.status_text()}")
                 
-            # Draw bounding boxes
-            for person in self.last_detection_boxes:
-                box = person.get("box", None)
-                name = person.get("name", "Unknown")
-                if box and len(box) == 4:
-                    x1, y1, x2, y2 = box
-                    cv2.rectangle(display_frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                    cv2.putText(display_frame, name, (x1, y1 - 10), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-            
-            # Display frame
-            rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(rgb)
-            imgtk = ImageTk.PhotoImage(image=img)
-            
-            if self.frame_panel is not None:
-                self._imgtk = imgtk
-                self.frame_panel.config(image=imgtk)
-            
             # Handle recognition trigger
             if self.is_recognition_running and not self.is_paused:
                 self.is_recognition_running = False
@@ -170,11 +161,14 @@ class PiFaceRecognitionGUI:
                     attendance = person.get("attendance", "")
                     if attendance in ["in", "out", "already_marked"]:
                         self.is_paused = True
-                        self.show_attendance_popup(frame, name, attendance)
+                        # Tk calls must run on the main loop, not this thread
+                        self.root.after(0, self.show_attendance_popup, frame, name, attendance)
                         marked = True
                         break
-                        
-            time.sleep(0.5)  # Slower loop for Pi
+
+    def draw_results(self, canvas, scale_x, scale_y):
+        """VideoPanel overlay: newest recognition boxes on the scaled preview"""
+        draw_boxes(canvas, list(self.last_detection_boxes), scale_x, scale_y, font_scale=0.6)
 
     def trigger_recognition(self):
         """Trigger face recognition"""
@@ -220,46 +214,15 @@ class PiFaceRecognitionGUI:
     def view_attendance(self):
         """View attendance records"""
         try:
-            response = requests.get(ATTENDANCE_URL, timeout=10)
-            if response.status_code == 200:
-                # Save to temporary file
-                with open("/tmp/attendance.csv", "wb") as f:
-                    f.write(response.content)
-                
-                # Show in popup
-                self.show_attendance_window()
-            else:
-                messagebox.showerror("Error", f"Failed to fetch attendance: {response.status_code}")
+            # Only rows added since the last view are downloaded
+            df = self.attendance_sync.refresh()
+            self.show_attendance_window(df)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to fetch attendance: {e}")
 
-    def show_attendance_window(self):
-        """Show attendance in popup window"""
-        try:
-            import pandas as pd
-            df = pd.read_csv("/tmp/attendance.csv")
-            
-            popup = tk.Toplevel(self.root)
-            popup.title("Attendance Records")
-            popup.geometry("600x400")
-            
-            # Create text widget with scrollbar
-            text_frame = tk.Frame(popup)
-            text_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-            
-            text_widget = tk.Text(text_frame, font=("Courier", 10))
-            scrollbar = tk.Scrollbar(text_frame, orient=tk.VERTICAL, command=text_widget.yview)
-            text_widget.configure(yscrollcommand=scrollbar.set)
-            
-            text_widget.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-            
-            # Insert attendance data
-            text_widget.insert(tk.END, df.to_string(index=False))
-            text_widget.config(state=tk.DISABLED)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to display attendance: {e}")
+    def show_attendance_window(self, df):
+        """Show attendance records in a paged, filterable table"""
+        AttendanceViewer(self.root, df)
 
     def update_status(self, text):
         """Update status label"""
@@ -5,15 +5,15 @@ A cross-platform GUI for the face recognition attendance system
 """
 
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
+from tkinter import ttk, messagebox
 import subprocess
 import os
 import sys
 import threading
 import time
-import pandas as pd
 from datetime import datetime
 import cv2
+from attendance_viewer import AttendanceViewer, load_attendance
 
 class ToolTip:
     def __init__(self, widget, text):
@@ -282,35 +282,9 @@ class FaceRecognitionGUI:
         """Show attendance data in a new window"""
         try:
             if os.path.exists("attendance.csv"):
-                df = pd.read_csv("attendance.csv")
+                df = load_attendance("attendance.csv")
                 if not df.empty:
-                    # Create attendance window
-                    attendance_window = tk.Toplevel(self.root)
-                    attendance_window.title("Attendance Records")
-                    attendance_window.geometry("600x400")
-                    attendance_window.resizable(True, True)
-                    
-                    # Create text widget
-                    text_widget = scrolledtext.ScrolledText(attendance_window, 
-                                                          wrap=tk.WORD,
-                                                          font=('Courier', 10))
-                    text_widget.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-                    
-                    # Format attendance data
-                    attendance_text = "Attendance Records:\n\n"
-                    attendance_text += "Date\t\tName\t\tTime\tType\n"
-                    attendance_text += "-" * 65 + "\n"
-                    
-                    for _, row in df.iterrows():
-                        date = row.get('Date', 'N/A')
-                        name = row.get('Name', 'N/A')
-                        time = row.get('Time', 'N/A')
-                        typ = row.get('Type', 'N/A')
-                        attendance_text += f"{date}\t{name}\t\t{time}\t{typ}\n"
-                    
-                    text_widget.insert(tk.END, attendance_text)
-                    text_widget.configure(state=tk.DISABLED)
-                    
+                    AttendanceViewer(self.root, df)
                 else:
                     messagebox.showinfo("No Records", "The attendance file is empty.")
             else:
@@ -0,0 +1,123 @@
+import itertools
+import threading
+import time
+
+def box_iou(a, b):
+    """Intersection over union of two [x1, y1, x2, y2] boxes"""
+    ix1, iy1 = max(a[0], b[0]), max(a[1], b[1])
+    ix2, iy2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / float(area_a + area_b - inter)
+
+def centroid_shift(box, track_box):
+    """Centre distance between two boxes, in multiples of the track box size"""
+    dx = (box[0] + box[2] - track_box[0] - track_box[2]) / 2.0
+    dy = (box[1] + box[3] - track_box[1] - track_box[3]) / 2.0
+    size = max(track_box[2] - track_box[0], track_box[3] - track_box[1], 1)
+    return (dx * dx + dy * dy) ** 0.5 / size
+
+class Track:
+    """A face followed across frames, with the last recognition result attached"""
+
+    def __init__(self, track_id, box, now):
+        self.track_id = track_id
+        self.box = box
+        self.first_seen = now
+        self.last_seen = now
+        self.hits = 1
+        self.name = None
+        self.confidence = 0
+        self.status = None
+        self.last_verified = None
+
+    def needs_verification(self, now, reverify_interval, unknown_retry_interval, shaky_confidence):
+        """True when the track has to be (re-)embedded on this frame"""
+        if self.last_verified is None:
+            return True
+        age = now - self.last_verified
+        if self.name is None:
+            return age >= unknown_retry_interval
+        if self.confidence < shaky_confidence:
+            return True
+        return age >= reverify_interval
+
+    def record(self, name, confidence, status, now):
+        self.name = name
+        self.confidence = confidence
+        self.status = status
+        self.last_verified = now
+
+class FaceTracker:
+    """Greedy IoU + centroid tracker giving stable ids to face boxes across frames.
+
+    Overlapping pairs are matched first, best IoU first. A face that moved
+    too far between two processed frames to overlap its old box can still
+    keep its track when its centre shifted by at most `centroid_threshold`
+    box sizes; those pairs are matched afterwards, nearest first.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, iou_threshold=0.3, max_age=2.0, centroid_threshold=0.5):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.centroid_threshold = centroid_threshold
+        self.tracks = []
+        self.lock = threading.Lock()
+
+    def update(self, boxes, now=None):
+        """Assign each box to an existing or new track; returns tracks in box order"""
+        now = time.time() if now is None else now
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_age]
+        pairs = []
+        for i, box in enumerate(boxes):
+            for j, track in enumerate(self.tracks):
+                iou = box_iou(box, track.box)
+                if iou >= self.iou_threshold:
+                    pairs.append(((1, iou), i, j))
+                else:
+                    shift = centroid_shift(box, track.box)
+                    if shift <= self.centroid_threshold:
+                        pairs.append(((0, -shift), i, j))
+        pairs.sort(reverse=True)
+        assigned = [None] * len(boxes)
+        used_tracks = set()
+        for _, i, j in pairs:
+            if assigned[i] is not None or j in used_tracks:
+                continue
+            track = self.tracks[j]
+            track.box = boxes[i]
+            track.last_seen = now
+            track.hits += 1
+            assigned[i] = track
+            used_tracks.add(j)
+        for i, box in enumerate(boxes):
+            if assigned[i] is None:
+                track = Track(next(self._ids), box, now)
+                self.tracks.append(track)
+                assigned[i] = track
+        return assigned
+
+class TrackerRegistry:
+    """One FaceTracker per client/camera id, dropped after `session_ttl` idle seconds"""
+
+    def __init__(self, session_ttl=300, **tracker_kwargs):
+        self.session_ttl = session_ttl
+        self.tracker_kwargs = tracker_kwargs
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, client_id, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            for key in [k for k, (_, used) in self.sessions.items() if now - used > self.session_ttl]:
+                del self.sessions[key]
+            tracker = self.sessions.get(client_id, (None, None))[0]
+            if tracker is None:
+                tracker = FaceTracker(**self.tracker_kwargs)
+            self.sessions[client_id] = (tracker, now)
+            return tracker
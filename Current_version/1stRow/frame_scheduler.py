@@ -0,0 +1,82 @@
+import time
+
+class FrameScheduler:
+    """Decides when the next camera frame gets detection and recognition.
+
+    The next frame is due 1/target_fps after the previous one started, or
+    once the measured processing time has passed, whichever is longer, so
+    a slow model lowers the rate instead of building a backlog. Frames come
+    from a LatestFrameCapture, so whatever arrives in between is grabbed
+    but never decoded on the capture thread and never waits in a queue. Latency is measured from
+    the frame's capture timestamp to the end of its processing; frames that
+    are already older than latency_budget when picked up are skipped.
+    """
+
+    def __init__(self, target_fps=2.5, latency_budget=0.5, report_interval=10.0, smoothing=0.2):
+        self.target_interval = 1.0 / target_fps
+        self.latency_budget = latency_budget
+        self.report_interval = report_interval
+        self.smoothing = smoothing
+        self.processing_time = None
+        self.stage_times = {}
+        self.frame_stages = {}
+        self.next_due = 0.0
+        self.started = None
+        self.captured_at = None
+        self.window_start = time.time()
+        self.processed = 0
+        self.stale = 0
+        self.latency_total = 0.0
+
+    def _average(self, old, new):
+        return new if old is None else old + self.smoothing * (new - old)
+
+    def wait(self, stop_event=None):
+        """Sleep until the next frame is due"""
+        delay = self.next_due - time.time()
+        if delay > 0:
+            if stop_event is not None:
+                stop_event.wait(delay)
+            else:
+                time.sleep(delay)
+
+    def begin(self, captured_at):
+        """Start processing a frame; False if it is already too old to be worth it"""
+        now = time.time()
+        if now - captured_at > self.latency_budget:
+            self.stale += 1
+            return False
+        self.started = now
+        self.captured_at = captured_at
+        return True
+
+    def record(self, stage, seconds):
+        """Add the time one stage (e.g. "detect", "recognize") took for this frame"""
+        self.frame_stages[stage] = self.frame_stages.get(stage, 0.0) + seconds
+
+    def end(self):
+        now = time.time()
+        for stage in set(self.stage_times) | set(self.frame_stages):
+            self.stage_times[stage] = self._average(self.stage_times.get(stage), self.frame_stages.get(stage, 0.0))
+        self.frame_stages = {}
+        spent = now - self.started
+        self.processing_time = self._average(self.processing_time, spent)
+        self.latency_total += now - self.captured_at
+        self.processed += 1
+        self.next_due = self.started + max(self.target_interval, spent)
+        if now - self.window_start >= self.report_interval:
+            print(f"[DEBUG] {self.report_text(now)}")
+            self.window_start = now
+            self.processed = self.stale = 0
+            self.latency_total = 0.0
+
+    def achieved_fps(self, now=None):
+        elapsed = (time.time() if now is None else now) - self.window_start
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def report_text(self, now=None):
+        stages = "".join(f"{stage} {avg * 1000:.0f} ms, " for stage, avg in sorted(self.stage_times.items()))
+        latency = self.latency_total / self.processed if self.processed else 0.0
+        return (f"Processing {self.achieved_fps(now):.1f}/{1.0 / self.target_interval:.1f} fps, "
+                f"{stages}latency {latency * 1000:.0f}/{self.latency_budget * 1000:.0f} ms, "
+                f"{self.stale} stale frame(s) skipped")
@@ -0,0 +1,237 @@
+import os
+import threading
+import time
+import cv2
+import numpy as np
+from deepface import DeepFace
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+EMBED_BATCH_SIZE = 32
+EMBEDDINGS_FILE = "embeddings.npz"
+
+def _normalize(vectors):
+    """L2-normalize embeddings row by row"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def align_face(face_img, target_size):
+    """Letterbox a BGR face crop to the model input size (DeepFace-style padding)"""
+    target_h, target_w = target_size
+    h, w = face_img.shape[:2]
+    factor = min(target_h / h, target_w / w)
+    new_w, new_h = max(1, int(w * factor)), max(1, int(h * factor))
+    resized = cv2.resize(face_img, (new_w, new_h))
+    aligned = np.zeros((target_h, target_w, 3), dtype=np.float32)
+    top = (target_h - new_h) // 2
+    left = (target_w - new_w) // 2
+    aligned[top:top + new_h, left:left + new_w] = resized
+    return aligned / 255.0
+
+class GalleryIndex:
+    """In-memory ArcFace embeddings of every image in known_faces.
+
+    The gallery is embedded once and kept as a contiguous, L2-normalized
+    float32 matrix so a lookup is a single matrix product instead of a
+    DeepFace.find directory scan per face. Crops are embedded in batches
+    with one forward pass of the ArcFace network.
+
+    The embeddings are persisted to known_faces/embeddings.npz, so a
+    restart only embeds images that are new or changed, and add/remove
+    update the index with copy-on-write swaps under the lock. Other
+    processes holding the same gallery pick up changes through
+    reload_if_changed().
+    """
+
+    def __init__(self, known_faces_dir, model_name="ArcFace"):
+        self.known_faces_dir = known_faces_dir
+        self.model_name = model_name
+        self.lock = threading.Lock()
+        self.names = []
+        self.identities = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.embeddings_path = os.path.join(known_faces_dir, EMBEDDINGS_FILE)
+        self.loaded_stamp = None
+        client = DeepFace.build_model(model_name)
+        # Newer DeepFace versions wrap the Keras model in a client object
+        self.network = getattr(client, "model", client)
+        if self.network is client:
+            # Bare Keras model: input_shape is (None, height, width, channels)
+            input_shape = self.network.input_shape[1:3]
+        else:
+            input_shape = getattr(client, "input_shape", None) or self.network.input_shape[1:3]
+        self.input_size = tuple(int(v) for v in input_shape)
+
+    def __len__(self):
+        return len(self.names)
+
+    def align(self, face_img):
+        """A BGR crop letterboxed to the network input, as embed_aligned() expects"""
+        return align_face(face_img, self.input_size)
+
+    def embed_aligned(self, aligned_imgs):
+        """Embed align()ed crops with a single forward pass, returns normalized (N, D)"""
+        if len(aligned_imgs) == 0:
+            return np.zeros((0, self.matrix.shape[1] if self.matrix.size else 0), dtype=np.float32)
+        embeddings = self.network.predict(np.stack(aligned_imgs), verbose=0)
+        return _normalize(embeddings)
+
+    def embed_batch(self, face_imgs):
+        """Embed a list of BGR crops with a single forward pass, returns normalized (N, D)"""
+        return self.embed_aligned([self.align(img) for img in face_imgs])
+
+    def embed(self, face_img):
+        """Embed a single BGR crop"""
+        return self.embed_batch([face_img])[0]
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.embeddings_path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def _read_saved(self):
+        """identity -> (mtime, embedding) from the embeddings file, or {} if unusable"""
+        try:
+            with np.load(self.embeddings_path) as data:
+                return {str(identity): (float(mtime), vector)
+                        for identity, mtime, vector in zip(data["identities"], data["mtimes"], data["matrix"])}
+        except (OSError, KeyError, ValueError) as e:
+            if os.path.exists(self.embeddings_path):
+                print(f"[WARN] Ignoring {self.embeddings_path}: {e}")
+            return {}
+
+    def _save(self, identities, matrix):
+        """Write the embeddings file atomically (caller holds the lock)"""
+        mtimes = [os.path.getmtime(identity) for identity in identities]
+        tmp = f"{self.embeddings_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, identities=np.array(identities, dtype=str),
+                     mtimes=np.array(mtimes, dtype=np.float64), matrix=matrix)
+        os.replace(tmp, self.embeddings_path)
+        self.loaded_stamp = self._file_stamp()
+
+    def _swap(self, identities, matrix):
+        self.identities = identities
+        self.names = [os.path.basename(identity).split(".")[0] for identity in identities]
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+
+    def build(self):
+        """Embed the known face images that are not already in the embeddings file"""
+        saved = self._read_saved()
+        identities, vectors, new_paths, new_images = [], {}, [], []
+        for root, _, files in os.walk(self.known_faces_dir):
+            for filename in sorted(files):
+                if not filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                path = os.path.join(root, filename)
+                cached = saved.get(path)
+                if cached is not None and cached[0] == os.path.getmtime(path):
+                    identities.append(path)
+                    vectors[path] = cached[1]
+                    continue
+                img = cv2.imread(path)
+                if img is None or img.size == 0:
+                    print(f"[WARN] Could not read {path}")
+                    continue
+                identities.append(path)
+                new_paths.append(path)
+                new_images.append(img)
+        for i in range(0, len(new_images), EMBED_BATCH_SIZE):
+            for path, vector in zip(new_paths[i:i + EMBED_BATCH_SIZE],
+                                    self.embed_batch(new_images[i:i + EMBED_BATCH_SIZE])):
+                vectors[path] = vector
+        matrix = np.stack([vectors[path] for path in identities]) if identities else np.zeros((0, 0), dtype=np.float32)
+        with self.lock:
+            self._swap(identities, matrix)
+            self._save(identities, self.matrix)
+        print(f"[INFO] Gallery index built with {len(identities)} face(s), {len(new_images)} newly embedded")
+        return self
+
+    def _reload(self):
+        """Load the embeddings file if another process changed it (caller holds the lock)"""
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self.loaded_stamp:
+            return False
+        saved = self._read_saved()
+        identities = [identity for identity in saved if os.path.exists(identity)]
+        matrix = np.stack([saved[i][1] for i in identities]) if identities else np.zeros((0, 0), dtype=np.float32)
+        self._swap(identities, matrix)
+        self.loaded_stamp = stamp
+        print(f"[INFO] Gallery reloaded with {len(identities)} face(s)")
+        return True
+
+    def reload_if_changed(self):
+        """Pick up enrollments made by other processes; a single stat call when nothing changed"""
+        if self._file_stamp() == self.loaded_stamp:
+            return False
+        with self.lock:
+            return self._reload()
+
+    def _delete_images(self, identities):
+        for identity in identities:
+            try:
+                os.remove(identity)
+            except FileNotFoundError:
+                pass
+
+    def add(self, name, face_img, replace=False):
+        """Embed one face crop, save it as known_faces/<name>[.n].png and append it.
+
+        With replace=True the person's existing images are removed in the
+        same swap. Returns the new image's path.
+        """
+        embedding = self.embed(face_img)
+        ok, png = cv2.imencode(".png", face_img)
+        if not ok:
+            raise ValueError("PNG encoding failed")
+        with self.lock:
+            self._reload()
+            keep = [i for i, n in enumerate(self.names) if not (replace and n == name)]
+            removed = [identity for identity, n in zip(self.identities, self.names) if replace and n == name]
+            self._delete_images(removed)
+            path = os.path.join(self.known_faces_dir, f"{name}.png")
+            if os.path.exists(path):
+                path = os.path.join(self.known_faces_dir, f"{name}.{time.time_ns()}.png")
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(png.tobytes())
+            os.replace(tmp, path)
+            rows = [self.matrix[keep]] if keep else []
+            self._swap([self.identities[i] for i in keep] + [path], np.concatenate(rows + [embedding[None, :]]))
+            self._save(self.identities, self.matrix)
+        return path
+
+    def remove(self, name):
+        """Drop every image of name from the index and known_faces; returns how many"""
+        with self.lock:
+            self._reload()
+            keep = [i for i, n in enumerate(self.names) if n != name]
+            removed = [identity for identity, n in zip(self.identities, self.names) if n == name]
+            if not removed:
+                return 0
+            self._delete_images(removed)
+            matrix = self.matrix[keep] if keep else np.zeros((0, 0), dtype=np.float32)
+            self._swap([self.identities[i] for i in keep], matrix)
+            self._save(self.identities, self.matrix)
+        return len(removed)
+
+    def search_batch(self, embeddings):
+        """Match (N, D) normalized embeddings against the gallery with one matrix multiply.
+
+        Returns a list of (name, identity, cosine distance) tuples, one per row.
+        """
+        with self.lock:
+            matrix, names, identities = self.matrix, self.names, self.identities
+        if len(names) == 0:
+            return [(None, None, None)] * len(embeddings)
+        similarities = np.asarray(embeddings, dtype=np.float32) @ matrix.T
+        best = np.argmax(similarities, axis=1)
+        distances = 1.0 - similarities[np.arange(len(best)), best]
+        return [(names[b], identities[b], float(d)) for b, d in zip(best, distances)]
+
+    def search(self, embedding):
+        """Return (name, identity, cosine distance) of the closest gallery face"""
+        return self.search_batch(_normalize(embedding)[None, :])[0]
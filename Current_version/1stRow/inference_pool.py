@@ -0,0 +1,66 @@
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+class PoolFullError(Exception):
+    """Raised when the request queue is at capacity"""
+
+def _timed_call(fn, args, submitted_at):
+    started_at = time.time()
+    return fn(*args), started_at - submitted_at
+
+class InferencePool:
+    """Bounded request queue in front of a pool of inference workers.
+
+    With workers > 0 each worker is a separate process that runs
+    `initializer` once to preload its own models. With workers == 0 jobs run
+    on a single in-process thread, which keeps the same queueing and
+    backpressure behaviour for small deployments.
+    """
+
+    def __init__(self, workers=0, max_queue=8, initializer=None):
+        self.workers = workers
+        self.max_queue = max_queue
+        if workers > 0:
+            self.slots = workers
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=initializer
+            )
+        else:
+            self.slots = 1
+            if initializer is not None:
+                initializer()
+            self.executor = ThreadPoolExecutor(max_workers=1)
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def queue_depth(self):
+        """Number of accepted jobs still waiting for a free worker"""
+        with self.lock:
+            return max(0, self.in_flight - self.slots)
+
+    def run(self, fn, *args):
+        """Run fn(*args) on a worker and block until it finishes.
+
+        Returns (result, stats) where stats has the queue depth seen on
+        arrival and the time spent waiting for a worker. Raises PoolFullError
+        when the queue is full so the caller can answer 503.
+        """
+        with self.lock:
+            depth = max(0, self.in_flight - self.slots)
+            if depth >= self.max_queue:
+                raise PoolFullError(f"Request queue full ({depth} waiting)")
+            self.in_flight += 1
+        try:
+            future = self.executor.submit(_timed_call, fn, args, time.time())
+            result, wait = future.result()
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        return result, {"depth": depth, "wait_ms": round(max(0.0, wait) * 1000, 1)}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
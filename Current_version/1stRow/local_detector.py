@@ -0,0 +1,56 @@
+import os
+import cv2
+from ultralytics import YOLO
+
+class LocalFaceDetector:
+    """Runs the YOLO face model on the kiosk CPU and cuts out face crops.
+
+    The PyTorch weights are exported once to ONNX next to the .pt file,
+    which ultralytics then runs through onnxruntime; if the export is not
+    possible the .pt model is used directly.
+    """
+
+    def __init__(self, weights="yolov11n-face.pt", imgsz=320, min_confidence=0.5,
+                 min_face_size=50, crop_size=160):
+        self.imgsz = imgsz
+        self.min_confidence = min_confidence
+        self.min_face_size = min_face_size
+        self.crop_size = crop_size
+        self.model = YOLO(self._runtime_weights(weights), task="detect")
+
+    def _runtime_weights(self, weights):
+        onnx_path = os.path.splitext(weights)[0] + ".onnx"
+        if os.path.exists(onnx_path):
+            return onnx_path
+        try:
+            return YOLO(weights).export(format="onnx", imgsz=self.imgsz)
+        except Exception as e:
+            print(f"[DEBUG] ONNX export failed, using {weights}: {e}")
+            return weights
+
+    def detect(self, frame):
+        """Full-frame [x1, y1, x2, y2] boxes that pass the confidence and size gates"""
+        boxes = []
+        for result in self.model(frame, imgsz=self.imgsz, verbose=False):
+            for box in result.boxes:
+                if box.conf[0].item() < self.min_confidence:
+                    continue
+                x1, y1, x2, y2 = map(int, box.xyxy[0])
+                if x2 - x1 < self.min_face_size or y2 - y1 < self.min_face_size:
+                    continue
+                boxes.append([x1, y1, x2, y2])
+        return boxes
+
+    def crop(self, frame, box):
+        """The face box as the server would cut it, downscaled to at most crop_size pixels.
+
+        Alignment to the ArcFace input (letterboxing) is left to the
+        server's GalleryIndex, so crops from either path embed identically.
+        """
+        x1, y1, x2, y2 = box
+        face = frame[max(0, y1):y2, max(0, x1):x2]
+        longest = max(face.shape[:2])
+        if longest > self.crop_size:
+            scale = self.crop_size / longest
+            face = cv2.resize(face, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return face
@@ -0,0 +1,90 @@
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+class Histogram:
+    """Prometheus-style histogram with one series per label value"""
+
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        with self.lock:
+            counts, total = self.series.get(label_value, ([0] * len(self.buckets), [0.0, 0]))
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+            total[0] += seconds
+            total[1] += 1
+            self.series[label_value] = (counts, total)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for label_value, (counts, (total, count)) in sorted(self.series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _format_labels({self.label: label_value, "le": bound})
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels({self.label: label_value, "le": "+Inf"})
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels({self.label: label_value})
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Counter:
+    """Prometheus-style counter, optionally split by one label"""
+
+    def __init__(self, name, help_text, label=None):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, label_value=None):
+        with self.lock:
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_value, value in sorted(self.values.items(), key=lambda kv: str(kv[0])):
+                labels = _format_labels({self.label: label_value} if self.label else None)
+                lines.append(f"{self.name}{labels} {value}")
+        return lines
+
+def new_request_stats():
+    """Per-request accumulator filled on the inference worker and merged by the API process"""
+    return {"stage_seconds": {}, "gate_counts": {}}
+
+@contextmanager
+def timed(stats, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stats["stage_seconds"][stage] = stats["stage_seconds"].get(stage, 0.0) + elapsed
+
+def count(stats, name, amount=1):
+    stats["gate_counts"][name] = stats["gate_counts"].get(name, 0) + amount
+
+def render_all(metrics):
+    """Prometheus text exposition format for a list of metrics"""
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,68 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+class MotionGate:
+    """Decides on the kiosk whether a frame is worth uploading.
+
+    Frames are downscaled to grayscale and compared against a running-
+    average background model. A frame passes when enough pixels changed,
+    for `hold_seconds` after the last change (a seated person stays still),
+    or when a keepalive upload is due.
+    """
+
+    def __init__(self, width=160, pixel_delta=25, min_changed=0.01,
+                 learning_rate=0.05, hold_seconds=3.0, keepalive_seconds=30.0):
+        self.width = width
+        self.pixel_delta = pixel_delta
+        self.min_changed = min_changed
+        self.learning_rate = learning_rate
+        self.hold_seconds = hold_seconds
+        self.keepalive_seconds = keepalive_seconds
+        self.background = None
+        self.last_motion = 0.0
+        self.last_pass = 0.0
+        self.passed = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def _preprocess(self, frame):
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(1, int(h * self.width / w))), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0).astype(np.float32)
+
+    def changed_fraction(self, frame):
+        """Fraction of pixels that differ from the background; updates the model"""
+        gray = self._preprocess(frame)
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray
+            return 1.0
+        diff = cv2.absdiff(gray, self.background)
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+        return float(np.count_nonzero(diff > self.pixel_delta)) / diff.size
+
+    def should_upload(self, frame, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            if self.changed_fraction(frame) >= self.min_changed:
+                self.last_motion = now
+            upload = (now - self.last_motion <= self.hold_seconds
+                      or now - self.last_pass >= self.keepalive_seconds)
+            if upload:
+                self.last_pass = now
+                self.passed += 1
+            else:
+                self.skipped += 1
+            return upload
+
+    def moving(self, now=None):
+        """True while the scene changed within the last hold_seconds (not a keepalive)"""
+        now = time.time() if now is None else now
+        return now - self.last_motion <= self.hold_seconds
+
+    def stats_text(self):
+        total = self.passed + self.skipped
+        ratio = self.passed / total if total else 0.0
+        return f"Uploaded {self.passed}/{total} frames ({ratio:.0%})"
@@ -0,0 +1,243 @@
+import json
+import os
+import random
+import threading
+import requests
+
+class OfflineQueue:
+    """Size-capped on-disk queue of uploads that could not reach the API.
+
+    Each entry is a JPEG plus a small JSON sidecar holding its kind
+    ("crop" or "frame"), capture time and form fields. Files are written
+    via a temporary name and os.replace, so a power cut leaves either a
+    whole entry or none. When the cap is exceeded the oldest entries are
+    dropped.
+    """
+
+    def __init__(self, directory, max_bytes=50 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.seq = 0
+        os.makedirs(directory, exist_ok=True)
+        self.entries = sorted(f[:-5] for f in os.listdir(directory) if f.endswith(".json"))
+        self.total_bytes = sum(self._entry_size(base) for base in self.entries)
+
+    def _path(self, base, ext):
+        return os.path.join(self.directory, base + ext)
+
+    def _entry_size(self, base):
+        size = 0
+        for ext in (".jpg", ".json"):
+            try:
+                size += os.path.getsize(self._path(base, ext))
+            except OSError:
+                pass
+        return size
+
+    def _write(self, path, data):
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def put(self, kind, jpeg, captured_at, fields=None):
+        meta = json.dumps({"kind": kind, "captured_at": captured_at, "fields": fields or {}}).encode()
+        with self.lock:
+            self.seq += 1
+            base = f"{int(captured_at * 1000):013d}-{os.getpid()}-{self.seq:06d}"
+            self._write(self._path(base, ".jpg"), jpeg)
+            self._write(self._path(base, ".json"), meta)
+            self.entries.append(base)
+            self.entries.sort()
+            self.total_bytes += len(jpeg) + len(meta)
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                oldest = self.entries[0]
+                print(f"[WARN] Offline queue full, dropping {oldest}")
+                self._remove(oldest)
+
+    def _remove(self, base):
+        self.total_bytes -= self._entry_size(base)
+        for ext in (".jpg", ".json"):
+            try:
+                os.remove(self._path(base, ext))
+            except OSError:
+                pass
+        self.entries.remove(base)
+
+    def peek(self, limit):
+        """Up to `limit` oldest entries of the same kind as the oldest one"""
+        batch = []
+        with self.lock:
+            bases = list(self.entries)
+        for base in bases:
+            try:
+                with open(self._path(base, ".json"), "rb") as f:
+                    meta = json.load(f)
+                with open(self._path(base, ".jpg"), "rb") as f:
+                    jpeg = f.read()
+            except (OSError, ValueError):
+                # Half-written or corrupt entry: drop it
+                with self.lock:
+                    if base in self.entries:
+                        self._remove(base)
+                continue
+            if batch and meta["kind"] != batch[0]["kind"]:
+                break
+            meta.update(base=base, jpeg=jpeg)
+            batch.append(meta)
+            if len(batch) >= limit:
+                break
+        return batch
+
+    def remove(self, batch):
+        with self.lock:
+            for entry in batch:
+                if entry["base"] in self.entries:
+                    self._remove(entry["base"])
+
+class OfflineUploader:
+    """Drains an OfflineQueue to the batch endpoints with exponential backoff.
+
+    Live upload paths call report_failure() when the API is unreachable and
+    check `online` to queue directly instead of waiting on a timeout; the
+    drain thread flips it back once a batch goes through, or, with nothing
+    queued, once a probe request gets any HTTP response. Entries that keep
+    failing with a server error are dropped after `max_attempts` tries.
+    """
+
+    def __init__(self, queue, session, urls, batch_size=16, timeout=30,
+                 min_backoff=1.0, max_backoff=300.0, idle_interval=2.0, max_attempts=5):
+        self.queue = queue
+        self.session = session
+        self.urls = urls
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.idle_interval = idle_interval
+        self.max_attempts = max_attempts
+        self.attempts = {}
+        self.backoff = min_backoff
+        self.online = True
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.drain_loop, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def report_failure(self):
+        self.online = False
+
+    def enqueue_frame(self, jpeg, captured_at, crop_fields=None):
+        self.queue.put("frame", jpeg, captured_at, crop_fields)
+
+    def enqueue_crops(self, jpegs, boxes, captured_at):
+        for jpeg, box in zip(jpegs, boxes):
+            self.queue.put("crop", jpeg, captured_at, {"box": box})
+
+    def _post(self, batch):
+        kind = batch[0]["kind"]
+        files = [("files", (f"{entry['base']}.jpg", entry["jpeg"], "image/jpeg")) for entry in batch]
+        form = {"captured_at": json.dumps([entry["captured_at"] for entry in batch])}
+        if kind == "crop":
+            form["boxes"] = json.dumps([entry["fields"].get("box") for entry in batch])
+        else:
+            form["transforms"] = json.dumps([
+                [f["offset_x"], f["offset_y"], f["scale"]]
+                + ([f["frame_width"], f["frame_height"]] if "frame_width" in f else [])
+                if "scale" in f else None
+                for f in (entry["fields"] for entry in batch)
+            ])
+        return self.session.post(self.urls[kind], files=files, data=form, timeout=self.timeout)
+
+    def _probe(self):
+        """Any HTTP answer, even 405 to a GET on a batch endpoint, means the API is reachable"""
+        self.session.get(next(iter(self.urls.values())), timeout=self.timeout)
+
+    def _retry_after(self, response):
+        try:
+            return float(response.headers.get("Retry-After", self.backoff))
+        except ValueError:
+            return self.backoff
+
+    def _count_failure(self, batch):
+        """Count a server error against each entry; drop the ones out of attempts"""
+        exhausted = []
+        for entry in batch:
+            self.attempts[entry["base"]] = self.attempts.get(entry["base"], 0) + 1
+            if self.attempts[entry["base"]] >= self.max_attempts:
+                exhausted.append(entry)
+        if exhausted:
+            print(f"[WARN] Dropping {len(exhausted)} queued upload(s) after {self.max_attempts} failed attempts")
+            self._forget(exhausted)
+
+    def _forget(self, batch):
+        self.queue.remove(batch)
+        for entry in batch:
+            self.attempts.pop(entry["base"], None)
+
+    def drain_loop(self):
+        while not self.stop_event.is_set():
+            if self.online and not len(self.queue):
+                self.stop_event.wait(self.idle_interval)
+                continue
+            try:
+                wait = self._drain_once()
+            except Exception as e:
+                # A dead drain thread would strand the queue, so log and back off instead
+                print(f"[WARN] Offline queue drain error: {e}")
+                wait = self.backoff
+            if wait is None:
+                self.online = True
+                self.backoff = self.min_backoff
+                continue
+            self.online = False
+            self.stop_event.wait(wait + random.uniform(0, wait / 2))
+            self.backoff = min(self.max_backoff, self.backoff * 2)
+
+    def _drain_once(self):
+        """Post the oldest batch, or probe the API when offline with nothing queued.
+
+        Returns None once the API answered, else the seconds to back off.
+        """
+        batch = self.queue.peek(self.batch_size)
+        try:
+            if not batch:
+                self._probe()
+                return None
+            response = self._post(batch)
+        except requests.RequestException as e:
+            print(f"[DEBUG] Offline queue drain failed: {e}")
+            return self.backoff
+        except Exception as e:
+            # A malformed entry fails the same way every time; give it a limited number of tries
+            print(f"[WARN] Could not send {len(batch)} queued upload(s): {e}")
+            self._count_failure(batch)
+            return self.backoff
+        if response.status_code == 200:
+            self._forget(batch)
+        elif response.status_code in (429, 503):
+            # Busy, not broken: retry without using up the entries' attempts
+            return self._retry_after(response)
+        elif 400 <= response.status_code < 500:
+            # The server will never accept these; do not retry them forever
+            print(f"[WARN] Dropping {len(batch)} queued upload(s): HTTP {response.status_code}")
+            self._forget(batch)
+        else:
+            self._count_failure(batch)
+            return self._retry_after(response)
+        return None
+
+    def status_text(self):
+        return f"{'Online' if self.online else 'Offline'}, {len(self.queue)} upload(s) queued"
@@ -0,0 +1,72 @@
+import random
+import threading
+import time
+
+class RateController:
+    """AIMD upload rate shared by the kiosk clients.
+
+    Each response under `target_latency` raises the rate by `increase`
+    uploads/s; a timeout, connection failure or 503/429 multiplies it by
+    `decrease` and honours Retry-After. Slow but successful responses
+    hold the rate. Intervals get +/-10% jitter so many kiosks started
+    together do not poll the server in lockstep.
+    """
+
+    def __init__(self, initial_rate=1.0, min_rate=0.2, max_rate=5.0, target_latency=0.5,
+                 increase=0.2, decrease=0.5):
+        self.rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+        self.next_start = 0.0
+        self.lock = threading.Lock()
+
+    def _reserve(self, now):
+        """Seconds until the next upload slot; reserves it when that is 0"""
+        wait = self.next_start - now
+        if wait <= 0:
+            self.next_start = now + random.uniform(0.9, 1.1) / self.rate
+            return 0.0
+        return wait
+
+    def try_acquire(self):
+        """Take the next upload slot if it is due; never blocks"""
+        with self.lock:
+            return self._reserve(time.time()) == 0.0
+
+    def acquire(self, stop_event):
+        """Block until an upload slot is due; False if stop_event was set meanwhile"""
+        while not stop_event.is_set():
+            with self.lock:
+                wait = self._reserve(time.time())
+            if wait == 0.0:
+                return True
+            stop_event.wait(min(wait, 0.5))
+        return False
+
+    def on_response(self, status_code, latency, retry_after=None):
+        with self.lock:
+            if status_code in (429, 503):
+                self._back_off(retry_after)
+            elif status_code == 200 and latency <= self.target_latency:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_failure(self):
+        """A timeout or connection error"""
+        with self.lock:
+            self._back_off(None)
+
+    def _back_off(self, retry_after):
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        delay = 1.0 / self.rate
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        self.next_start = max(self.next_start, time.time() + delay)
+
+    def status_text(self):
+        return f"Upload rate: {self.rate:.1f}/s"
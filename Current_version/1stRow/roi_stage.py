@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+
+class RoiStage:
+    """Restricts local detection to the ROI polygon.
+
+    The polygon's bounding rectangle and a mask of that rectangle are built
+    once, on the first frame of a given size. Detection then runs on the
+    rectangle (a view, no copy) and a box is kept when the mask is set at
+    its centre, a single array lookup instead of pointPolygonTest per box.
+    Frames that do not contain the whole ROI (a different camera
+    resolution) are passed through whole and every box is kept.
+    """
+
+    def __init__(self, polygon):
+        self.polygon = None if polygon is None else np.asarray(polygon, np.int32)
+        self.frame_shape = None
+        self.rect = None
+        self.mask = None
+
+    def _prepare(self, shape):
+        self.frame_shape = shape
+        self.rect = self.mask = None
+        if self.polygon is None:
+            return
+        x, y, w, h = cv2.boundingRect(self.polygon)
+        if x < 0 or y < 0 or x + w > shape[1] or y + h > shape[0]:
+            print(f"[WARN] ROI {x},{y} {w}x{h} does not fit {shape[1]}x{shape[0]} frames, using the full frame")
+            return
+        self.rect = (x, y, w, h)
+        self.mask = np.zeros((h, w), np.uint8)
+        cv2.fillPoly(self.mask, [self.polygon - (x, y)], 1)
+
+    def crop(self, frame):
+        """(region to run detection on, (offset_x, offset_y) of that region)"""
+        if frame.shape[:2] != self.frame_shape:
+            self._prepare(frame.shape[:2])
+        if self.rect is None:
+            return frame, (0, 0)
+        x, y, w, h = self.rect
+        return frame[y:y + h, x:x + w], (x, y)
+
+    def contains(self, box):
+        """True if the centre of a full-frame [x1, y1, x2, y2] box lies inside the ROI"""
+        if self.rect is None:
+            return True
+        x, y, w, h = self.rect
+        cx = (box[0] + box[2]) // 2 - x
+        cy = (box[1] + box[3]) // 2 - y
+        return 0 <= cx < w and 0 <= cy < h and bool(self.mask[cy, cx])
+
+    def draw(self, frame, color=(255, 0, 0)):
+        if self.polygon is not None:
+            cv2.polylines(frame, [self.polygon], isClosed=True, color=color, thickness=2)
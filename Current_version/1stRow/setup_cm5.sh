@@ -61,6 +61,7 @@ pip3 install --user opencv-python
 pip3 install --user pillow
 pip3 install --user requests
 pip3 install --user pandas
+pip3 install --user ultralytics onnx onnxruntime  # On-device face detection (LOCAL_DETECTION)
 
 # Step 4: Enable camera interface
 print_status "Enabling camera interface..."
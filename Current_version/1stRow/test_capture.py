@@ -9,16 +9,17 @@ import numpy as np
 from PIL import Image, ImageTk
 import tkinter as tk
 from tkinter import messagebox
+from camera_source import LatestFrameCapture
 
 # Cloud API URL
-API_URL = "http://13.201.230.71:5000/recognize"
+API_URL = "http://13.201.230.71:5000/detect"
 
 def test_face_capture():
     """Test face capture with cloud API"""
     print("Testing face capture functionality...")
     
     # Open camera
-    cap = cv2.VideoCapture(0)
+    cap = LatestFrameCapture(0)
     if not cap.isOpened():
         print("Error: Cannot open camera")
         return False
@@ -42,11 +43,11 @@ def test_face_capture():
         try:
             with open(temp_path, "rb") as img_file:
                 files = {"file": img_file}
-                response = requests.post(API_URL, files=files, timeout=10)
+                response = requests.post(API_URL, files=files, params={"max_side": 640}, timeout=10)
             
             if response.status_code == 200:
                 data = response.json()
-                detected_faces = data.get("recognized", [])
+                detected_faces = data.get("faces", [])
                 
                 if detected_faces:
                     print(f"✓ Face detected: {len(detected_faces)} face(s)")
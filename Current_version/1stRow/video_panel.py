@@ -0,0 +1,79 @@
+import threading
+import tkinter as tk
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+def draw_boxes(canvas, people, scale_x=1.0, scale_y=1.0, font_scale=0.6):
+    """Draw API results ({"box", "name"}) given in frame coordinates onto a scaled canvas"""
+    for person in people:
+        box = person.get("box", None)
+        if not box or len(box) != 4:
+            continue
+        x1, y1, x2, y2 = (int(box[0] * scale_x), int(box[1] * scale_y),
+                          int(box[2] * scale_x), int(box[3] * scale_y))
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(canvas, person.get("name", "Unknown"), (x1, y1 - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 255, 0), 2)
+
+class VideoPanel:
+    """Tk label that shows camera frames at a fixed rate, safely from any thread.
+
+    Worker threads call publish(); the newest frame waits in a single slot
+    and older unrendered frames are simply replaced. The Tk main loop picks
+    it up every 1/fps seconds with after(), resizes it with cv2.resize into
+    a preallocated buffer, lets `overlay(canvas, scale_x, scale_y)` draw on
+    the small canvas, and pastes it into one PhotoImage that is reused for
+    the lifetime of the panel.
+    """
+
+    def __init__(self, parent, width, height, fps=20, overlay=None, **label_kwargs):
+        self.width = width
+        self.height = height
+        self.interval_ms = max(1, int(1000 / fps))
+        self.overlay = overlay
+        self.canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        self.rgb = np.zeros((height, width, 3), dtype=np.uint8)
+        self.photo = ImageTk.PhotoImage("RGB", (width, height))
+        self.label = tk.Label(parent, image=self.photo, width=width, height=height, **label_kwargs)
+        self.slot_lock = threading.Lock()
+        self.pending = None
+        self.rendered = 0
+        self.after_id = None
+
+    def pack(self, **kwargs):
+        self.label.pack(**kwargs)
+
+    def grid(self, **kwargs):
+        self.label.grid(**kwargs)
+
+    def publish(self, frame):
+        """Hand a BGR frame to the panel; callable from any thread"""
+        with self.slot_lock:
+            self.pending = frame
+
+    def start(self):
+        if self.after_id is None:
+            self.after_id = self.label.after(0, self._tick)
+
+    def stop(self):
+        if self.after_id is not None:
+            self.label.after_cancel(self.after_id)
+            self.after_id = None
+
+    def _tick(self):
+        with self.slot_lock:
+            frame, self.pending = self.pending, None
+        if frame is not None:
+            self.show(frame)
+        self.after_id = self.label.after(self.interval_ms, self._tick)
+
+    def show(self, frame):
+        """Render a BGR frame immediately (Tk thread only)"""
+        h, w = frame.shape[:2]
+        cv2.resize(frame, (self.width, self.height), dst=self.canvas, interpolation=cv2.INTER_LINEAR)
+        if self.overlay is not None:
+            self.overlay(self.canvas, self.width / w, self.height / h)
+        cv2.cvtColor(self.canvas, cv2.COLOR_BGR2RGB, dst=self.rgb)
+        self.photo.paste(Image.fromarray(self.rgb))
+        self.rendered += 1
@@ -23,8 +23,9 @@ def draw_roi(frame, points):
     if len(points) > 1:
         cv2.polylines(frame, [np.array(points)], isClosed=True, color=(255, 0, 0), thickness=2)
 
-def save_roi(points, filename):
-    data = {"roi": points}
+def save_roi(points, filename, frame_size):
+    # The frame size lets kiosks with other camera resolutions scale the ROI
+    data = {"roi": points, "frame_size": frame_size}
     with open(filename, "w") as f:
         json.dump(data, f)
     print(f"ROI saved to {filename}")
@@ -54,7 +55,7 @@ def main():
 
         key = cv2.waitKey(1) & 0xFF
         if key == ord('s') and len(roi_points) >= 3:
-            save_roi(roi_points, OUTPUT_JSON)
+            save_roi(roi_points, OUTPUT_JSON, [frame.shape[1], frame.shape[0]])
             break
         elif key == ord('q'):
             break
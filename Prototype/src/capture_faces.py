@@ -1,6 +1,7 @@
 import cv2
 import os
 from mtcnn import MTCNN
+from camera_source import LatestFrameCapture
 
 def get_next_student_number(base_path):
     existing_folders = [d for d in os.listdir(base_path) if os.path.isdir(os.path.join(base_path, d))]
@@ -41,7 +42,7 @@ def capture_faces(student_id, base_path="data/images", num_images=100):
     
     student_folder, student_number = create_student_folder(base_path)
 
-    cap = cv2.VideoCapture(0)
+    cap = LatestFrameCapture(0)
     detector = MTCNN()
     count = 0
 
@@ -4,6 +4,7 @@ import tensorflow as tf
 import joblib
 import face_recognition
 from deepface import DeepFace
+from camera_source import LatestFrameCapture
 
 MODEL_DIR = "models/face_recognition/"
 model = tf.keras.models.load_model(f"{MODEL_DIR}/face_recognition_model.h5")
@@ -14,12 +15,8 @@ ATTENDANCE_FILE = "data/csv/attendance.csv"
 
 
 CAMERA_INDEX = 0
-cap = cv2.VideoCapture(CAMERA_INDEX)
-
-cap.set(cv2.CAP_PROP_FPS, 30)
-cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+# Read on a background thread, so recognition always gets the newest frame instead of a buffered one
+cap = LatestFrameCapture(CAMERA_INDEX, width=640, height=480)
 
 print("Real-time face recognition started...")
 while True: